@@ -74,6 +74,7 @@ async def main() -> None:
                 print(f"  • {s.name!r}: browse failed: {type(e).__name__}: {e}")
 
     await cp.aclose()
+    await discovery.close_discovery()
     print("\nDone.")
 
 
@@ -110,6 +110,7 @@ async def main() -> None:
             except Exception:
                 pass
         await cp.aclose()
+        await discovery.close_discovery()
 
 
 if __name__ == "__main__":
@@ -21,7 +21,14 @@ import logging
 import os
 import socket
 
-from async_upnp_client.aiohttp import AiohttpNotifyServer, AiohttpRequester
+import aiohttp
+from async_upnp_client.aiohttp import AiohttpNotifyServer, AiohttpSessionRequester
+from async_upnp_client.client import (
+    HttpRequest,
+    HttpResponse,
+    UpnpDevice,
+    UpnpRequester,
+)
 from async_upnp_client.client_factory import UpnpFactory
 from async_upnp_client.event_handler import UpnpEventHandler
 
@@ -57,16 +64,95 @@ def detect_local_ip() -> str:
         s.close()
 
 
+class _KeepAliveRequester(AiohttpSessionRequester):
+    """UPnP requester over one keep-alive aiohttp session.
+
+    async_upnp_client's AiohttpRequester opens a fresh ClientSession per
+    request, so every SOAP action (SetAVTransportURI, Play, SetNext...) and
+    SUBSCRIBE paid a new TCP handshake. This keeps one pooled session instead,
+    opened on demand on the running loop: cached UpnpDevices hold on to this
+    requester, so it must stay usable after aclose() closes the session.
+
+    aclose() can land while a request is still running (the last playback
+    session leaves mid-browse), so the session is only closed once no request
+    is pending; a request that starts meanwhile keeps it open.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(session=None)  # type: ignore[arg-type]  # opened lazily
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending = 0
+        self._close_when_idle = False
+
+    async def async_http_request(self, http_request: HttpRequest) -> HttpResponse:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Renderers' embedded servers handle few connections; keep a small
+            # per-host pool alive across the actions of a play/advance.
+            connector = aiohttp.TCPConnector(limit_per_host=4, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        self._close_when_idle = False  # in use again: cancel a deferred close
+        self._pending += 1
+        try:
+            return await super().async_http_request(http_request)
+        finally:
+            self._pending -= 1
+            if self._close_when_idle and not self._pending:
+                await self._close_session()
+
+    async def aclose(self) -> None:
+        """Close the pooled session now, or once in-flight requests finish."""
+        if self._pending:
+            self._close_when_idle = True
+            return
+        await self._close_session()
+
+    async def _close_session(self) -> None:
+        session, self._session, self._loop = self._session, None, None
+        self._close_when_idle = False
+        if session is not None and not session.closed:
+            await session.close()
+
+
+class _CachingFactory(UpnpFactory):
+    """UpnpFactory that reuses the parsed UpnpDevice per description URL.
+
+    Every play_tracks (and every MediaServer browse) builds a device from its
+    location; without this, each one re-fetches the device description plus
+    every service SCPD and re-parses the tree. The cache dict is owned by the
+    ControlPoint so it outlives the notify-server infra between sessions.
+    Sharing is sequential (the per-UDN lock serialises session swaps), and a new
+    profile device re-binds the services' event callbacks on subscribe.
+    """
+
+    def __init__(self, requester: UpnpRequester, cache: dict[str, UpnpDevice]) -> None:
+        super().__init__(requester)
+        self._device_cache = cache
+
+    async def async_create_device(self, description_url: str) -> UpnpDevice:
+        device = self._device_cache.get(description_url)
+        if device is None:
+            device = await super().async_create_device(description_url)
+            self._device_cache[description_url] = device
+        return device
+
+
 class ControlPoint:
     """Owns shared UPnP event infrastructure and the per-renderer session map."""
 
     def __init__(self) -> None:
-        self._requester: AiohttpRequester | None = None
+        # Outlives aclose() (cached devices reference it); only its pooled HTTP
+        # session is closed there, and reopened on the next request.
+        self._requester = _KeepAliveRequester()
         self._notify_server: AiohttpNotifyServer | None = None
         self.event_handler: UpnpEventHandler | None = None
         self.factory: UpnpFactory | None = None
         # renderer UDN → session object (opaque; QueueSession in practice).
         self.sessions: dict[str, object] = {}
+        # description URL → parsed UpnpDevice, reused across sessions (see
+        # _CachingFactory). Survives aclose(); dropped per device on byebye.
+        self._device_cache: dict[str, UpnpDevice] = {}
         # Serialises lazy infra startup so two concurrent first-plays don't both
         # build and bind a notify server.
         self._infra_lock = asyncio.Lock()
@@ -76,6 +162,7 @@ class ControlPoint:
         # Passive SSDP listener + debounced "device set changed" refresh.
         self._ssdp_listener = None
         self._on_change = None
+        self._on_byebye = None
         self._refresh_task: asyncio.Task | None = None
         # Periodic read-only session state watchdog.
         self._watchdog_task: asyncio.Task | None = None
@@ -94,13 +181,12 @@ class ControlPoint:
             if self._notify_server is not None:
                 return
             source_ip = detect_local_ip()
-            self._requester = AiohttpRequester()
             self._notify_server = AiohttpNotifyServer(
                 requester=self._requester,
                 source=(source_ip, 0),  # OS picks a free port
             )
             self.event_handler = UpnpEventHandler(self._notify_server, self._requester)
-            self.factory = UpnpFactory(self._requester)
+            self.factory = _CachingFactory(self._requester, self._device_cache)
             await self._notify_server.async_start_server()
             logger.info(
                 f"UPnP notify server started on {source_ip}, "
@@ -112,8 +198,8 @@ class ControlPoint:
         if self._notify_server:
             await self._notify_server.async_stop_server()
             logger.info("UPnP notify server stopped")
+        await self._requester.aclose()
         self._notify_server = None
-        self._requester = None
         self.event_handler = None
         self.factory = None
 
@@ -137,6 +223,17 @@ class ControlPoint:
             self._ssdp_listener = None
             logger.info("SSDP listener stopped")
 
+    def forget_device(self, udn: str, *locations: str) -> None:
+        """Drop cached device trees for `udn` (it left, or may have changed),
+        plus any cached at `locations` (e.g. an OpenHome sibling device, which
+        has its own UDN)."""
+        stale = [
+            url for url, dev in self._device_cache.items()
+            if dev.udn == udn or url in locations
+        ]
+        for url in stale:
+            del self._device_cache[url]
+
     def lock_for(self, udn: str) -> asyncio.Lock:
         """A stable per-renderer lock (created on first use). Held around the
         session-swap critical section in play_tracks."""
@@ -148,10 +245,12 @@ class ControlPoint:
 
     # -- passive SSDP listener (live device cache) -------------------------
 
-    async def start_discovery_listener(self, on_change) -> None:
+    async def start_discovery_listener(self, on_change, on_byebye=None) -> None:
         """Listen for SSDP alive/byebye and call `on_change` (an async no-arg
         callable) when the device set changes, debounced. `on_change` typically
-        refreshes the discovery caches. Idempotent.
+        refreshes the discovery caches. `on_byebye` (a sync callable taking the
+        device UDN) is called immediately on ssdp:byebye so that one device can be
+        dropped from the cache without waiting for the refresh. Idempotent.
 
         Intended for the long-lived streamable-http transport; stdio uses
         on-demand search instead (a short-lived subprocess gains little from a
@@ -163,6 +262,7 @@ class ControlPoint:
         from async_upnp_client.ssdp_listener import SsdpListener
 
         self._on_change = on_change
+        self._on_byebye = on_byebye
         # alive/byebye/changed all mean "the device set may have changed".
         relevant = {
             SsdpSource.ADVERTISEMENT_ALIVE,
@@ -174,6 +274,10 @@ class ControlPoint:
 
         async def _callback(device, change, source) -> None:
             try:
+                if source == SsdpSource.ADVERTISEMENT_BYEBYE:
+                    self.forget_device(device.udn)
+                    if self._on_byebye is not None:
+                        self._on_byebye(device.udn)
                 if source in relevant:
                     self._schedule_refresh()
             except Exception as e:  # noqa: BLE001 - never raise into the library
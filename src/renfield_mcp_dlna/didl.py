@@ -1,8 +1,78 @@
-"""DIDL-Lite metadata generation for DLNA media renderers."""
+"""DIDL-Lite metadata generation for DLNA media renderers.
 
-from didl_lite import didl_lite
+Both builders are pure functions of their (hashable, string) arguments, so they
+are memoised process-wide: QueueSession already caches per track URL within one
+session, and this also covers a new session replaying the same tracks.
 
+The documents have a fixed shape, so they are rendered from string templates
+rather than built as a didl_lite element tree and serialised. The templates
+reproduce didl_lite's output byte for byte: same namespaces, element order and
+escaping, non-ASCII written as numeric character references (didl_lite
+serialises us-ascii), and an empty <res/> self-closed. The tests pin that
+parity, including non-ASCII and empty-field cases.
+"""
 
+from functools import lru_cache
+
+# ~1 KB per entry, so the cache is bounded at roughly 0.5 MB per builder.
+_DIDL_CACHE_SIZE = 512
+
+_DIDL_OPEN = (
+    '<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/"'
+    ' xmlns:dc="http://purl.org/dc/elements/1.1/"'
+    ' xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/"'
+    ' xmlns:sec="http://www.sec.co.kr/">'
+    '<item id="0" parentID="-1" restricted="1">'
+)
+_DIDL_ITEM = (
+    _DIDL_OPEN + "<dc:title>{title}</dc:title><upnp:class>{upnp_class}</upnp:class>"
+    "{extra}{res}</item></DIDL-Lite>"
+)
+# ElementTree self-closes an element with no text, so an empty URL gives <res/>.
+_RES = '<res protocolInfo="{protocol_info}">{url}</res>'
+_RES_EMPTY = '<res protocolInfo="{protocol_info}" />'
+# ElementTree's entity escaping, one str.translate pass per value (text: & < >;
+# attributes also the quote and whitespace). The tables alone don't make the
+# output match didl_lite: _escape() also writes non-ASCII as character refs.
+_TEXT_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_ATTR_ESCAPE = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        "\n": "&#10;",
+        "\r": "&#13;",
+        "\t": "&#09;",
+    }
+)
+
+
+def _escape(value: str, table: dict) -> str:
+    """Escape `value` and, like didl_lite's us-ascii serialisation, turn any
+    non-ASCII character into a numeric reference (ü → &#252;)."""
+    out = value.translate(table)
+    if out.isascii():
+        return out
+    return out.encode("ascii", "xmlcharrefreplace").decode("ascii")
+
+
+def _render(
+    upnp_class: str, url: str, title: str, protocol_info: str, extra: str = ""
+) -> str:
+    res = _RES if url else _RES_EMPTY
+    return _DIDL_ITEM.format(
+        title=_escape(title or "Unknown", _TEXT_ESCAPE),
+        upnp_class=upnp_class,
+        extra=extra,
+        res=res.format(
+            protocol_info=_escape(protocol_info, _ATTR_ESCAPE),
+            url=_escape(url, _TEXT_ESCAPE),
+        ),
+    )
+
+
+@lru_cache(maxsize=_DIDL_CACHE_SIZE)
 def build_didl_metadata(
     url: str,
     title: str = "",
@@ -20,34 +90,26 @@ def build_didl_metadata(
     `dlna_features` is the 4th protocolInfo field (DLNA.ORG_OP/FLAGS/PN). The
     metadata strategy supplies it; "*" means unspecified (the original default).
     """
-    # Build protocol info string (required by UPnP AV)
-    protocol_info = f"http-get:*:{mime_type}:{dlna_features}"
-
-    # Create the resource (playback URL + protocol info)
-    resource = didl_lite.Resource(
-        uri=url,
-        protocol_info=protocol_info,
-    )
-
-    # Build kwargs for MusicTrack constructor
-    kwargs: dict = {
-        "id": "0",
-        "parent_id": "-1",
-        "title": title or "Unknown",
-        "restricted": "1",
-        "resources": [resource],
-    }
+    # Optional fields, in the element order didl_lite emits them.
+    extra = ""
     if artist:
-        kwargs["creator"] = artist
+        extra += f"<dc:creator>{_escape(artist, _TEXT_ESCAPE)}</dc:creator>"
     if album:
-        kwargs["album"] = album
+        extra += f"<upnp:album>{_escape(album, _TEXT_ESCAPE)}</upnp:album>"
     if art_url:
-        kwargs["album_art_uri"] = art_url
-
-    item = didl_lite.MusicTrack(**kwargs)
-    return didl_lite.to_xml_string(item).decode("utf-8")
+        extra += (
+            f"<upnp:albumArtURI>{_escape(art_url, _TEXT_ESCAPE)}</upnp:albumArtURI>"
+        )
+    return _render(
+        "object.item.audioItem.musicTrack",
+        url,
+        title,
+        f"http-get:*:{mime_type}:{dlna_features}",
+        extra,
+    )
 
 
+@lru_cache(maxsize=_DIDL_CACHE_SIZE)
 def build_video_didl_metadata(
     url: str,
     title: str = "",
@@ -60,14 +122,9 @@ def build_video_didl_metadata(
     renderers (Smart TVs). `dlna_features` carries DLNA.ORG_PN/OP/FLAGS that
     strict TVs require (supplied by the metadata strategy).
     """
-    protocol_info = f"http-get:*:{mime_type}:{dlna_features}"
-    resource = didl_lite.Resource(uri=url, protocol_info=protocol_info)
-
-    item = didl_lite.Movie(
-        id="0",
-        parent_id="-1",
-        title=title or "Unknown",
-        restricted="1",
-        resources=[resource],
+    return _render(
+        "object.item.videoItem.movie",
+        url,
+        title,
+        f"http-get:*:{mime_type}:{dlna_features}",
     )
-    return didl_lite.to_xml_string(item).decode("utf-8")
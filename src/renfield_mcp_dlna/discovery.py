@@ -1,36 +1,103 @@
 """SSDP discovery and renderer cache for DLNA MediaRenderers."""
 
 import asyncio
+import io
+import json
 import logging
+import os
+import re
 import socket
 import struct
+import tempfile
 import time
-from dataclasses import dataclass
-from urllib.parse import urlparse
+import uuid
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, fields, replace
+from urllib.parse import urljoin, urlparse
 
 import aiohttp
-
-# defusedxml: device descriptions come from LAN devices and UPnP is spoofable,
-# so parse untrusted XML with the hardened parser (blocks billion-laughs entity
-# expansion / XXE that stdlib ElementTree allows).
-import defusedxml.ElementTree as ET  # noqa: N817
-from defusedxml.common import DefusedXmlException
+from lxml import etree as ET
 
 logger = logging.getLogger(__name__)
 
+# Device descriptions come from LAN devices and UPnP is spoofable, so untrusted
+# XML goes through a hardened lxml parser: no entity substitution (blocks XXE /
+# billion-laughs expansion), no DTD loading, no network access. lxml's C parser
+# is also markedly faster than ElementTree on these namespaced documents, which
+# dominate discovery CPU time.
+_XML_PARSER = ET.XMLParser(resolve_entities=False, load_dtd=False, no_network=True)
+
 # UPnP XML namespaces
 _NS_DEVICE = "urn:schemas-upnp-org:device-1-0"
 _NS_SERVICE = "urn:schemas-upnp-org:service-1-0"
 _AVTRANSPORT_TYPE = "urn:schemas-upnp-org:service:AVTransport:1"
 _RENDERING_CONTROL_TYPE = "urn:schemas-upnp-org:service:RenderingControl:1"
 
+
+def _xpath(expr: str) -> ET.XPath:
+    # smart_strings=False: lxml's default "smart" strings keep a reference to
+    # their source tree, which would pin every parsed description in memory for
+    # as long as a cached DlnaRenderer holds its name/UDN.
+    return ET.XPath(expr, namespaces={"d": _NS_DEVICE}, smart_strings=False)
+
+
+# Device-description lookups, compiled once at import rather than re-parsing a
+# Clark-notation path on every find()/findtext() for every device.
+_DEVICE_XP = _xpath("d:device")
+_URL_BASE_XP = _xpath("string(d:URLBase)")
+_FRIENDLY_NAME_XP = _xpath("string(d:friendlyName)")
+_UDN_XP = _xpath("string(d:UDN)")
+_MANUFACTURER_XP = _xpath("string(d:manufacturer)")
+_MODEL_NAME_XP = _xpath("string(d:modelName)")
+_SERVICE_LIST_XP = _xpath("d:serviceList")
+_SERVICE_XP = _xpath("d:service")
+_SERVICE_TYPE_XP = _xpath("string(d:serviceType)")
+_CONTROL_URL_XP = _xpath("string(d:controlURL)")
+_SCPD_URL_XP = _xpath("string(d:SCPDURL)")
+# The SCPD is streamed (see _scpd_has_action), so it matches on tags instead.
+_SCPD_ACTION_TAG = f"{{{_NS_SERVICE}}}action"
+_SCPD_NAME_TAG = f"{{{_NS_SERVICE}}}name"
+
 # SSDP constants
 _SSDP_ADDR = "239.255.255.250"
 _SSDP_PORT = 1900
 _SEARCH_TARGET = "urn:schemas-upnp-org:device:MediaRenderer:1"
+_SSDP_RCVBUF = 1 << 20  # 1 MiB
+
+
+def _env_seconds(name: str, default: float) -> float:
+    """A non-negative duration (seconds) from the environment, else `default`."""
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        logger.warning(f"Ignoring non-numeric {name}; using {default}s")
+        return default
+
+
+# Cache. Each renderer is timestamped when a search last saw it and is dropped
+# once older than CACHE_TTL. Within REFRESH_AHEAD_SECS of the last search
+# expiring, callers still get the cached list immediately while a background
+# search refreshes it (stale-while-revalidate), so a tool call only waits on
+# SSDP when the cache is empty or fully expired.
+CACHE_TTL = _env_seconds("RENFIELD_CACHE_TTL", 300)  # 5 minutes
+REFRESH_AHEAD_SECS = _env_seconds("RENFIELD_REFRESH_AHEAD_SECS", 60)
+
+
+def _env_int(name: str, default: int, lo: int, hi: int) -> int:
+    """An integer from the environment clamped to [lo, hi], else `default`."""
+    try:
+        return max(lo, min(hi, int(os.getenv(name, default))))
+    except ValueError:
+        logger.warning(f"Ignoring non-integer {name}; using {default}")
+        return default
+
 
-# Cache
-CACHE_TTL = 300  # 5 minutes
+# M-SEARCH tuning. TTL 4 (what discovery has always sent) reaches renderers a
+# few router hops away on routed/multi-subnet LANs; MX (the max seconds a device
+# may delay its reply) bounds how long a search must listen, so each scan waits
+# MX + 1s. UDA allows MX 1-5.
+_SSDP_TTL = _env_int("RENFIELD_SSDP_TTL", 4, 1, 255)
+_SSDP_MX = _env_int("RENFIELD_SSDP_MX", 2, 1, 5)
 
 
 # Version-flexible: real Linn advertises Playlist:1 / Volume:4 etc. Match the
@@ -38,7 +105,7 @@ CACHE_TTL = 300  # 5 minutes
 _OPENHOME_PLAYLIST_PREFIX = "urn:av-openhome-org:service:Playlist:"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DlnaRenderer:
     """Discovered DLNA MediaRenderer.
 
@@ -65,13 +132,22 @@ class DlnaRenderer:
     openhome_location: str = ""
 
 
-_renderer_cache: list[DlnaRenderer] = []
-_cache_time: float = 0
+# One keep-alive HTTP session for all discovery GETs. A device serves its
+# description and SCPD(s) from the same host:port, and repeat searches hit the
+# same devices, so pooled connections save a TCP handshake per fetch. Bound to the
+# loop it was created on (see _http_session).
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+
+# renderer UDN → (renderer, time a search last saw it).
+_renderer_cache: dict[str, tuple[DlnaRenderer, float]] = {}
+_cache_time: float = 0  # when the last renderer search completed
+_refresh_task: asyncio.Task | None = None
 
 _CONTENT_DIRECTORY_PREFIX = "urn:schemas-upnp-org:service:ContentDirectory:"
 
 
-@dataclass
+@dataclass(slots=True)
 class DlnaServer:
     """Discovered DLNA MediaServer (exposes a ContentDirectory to browse)."""
 
@@ -94,98 +170,129 @@ def _build_msearch(search_target: str = _SEARCH_TARGET) -> bytes:
         "M-SEARCH * HTTP/1.1\r\n"
         f"HOST: {_SSDP_ADDR}:{_SSDP_PORT}\r\n"
         'MAN: "ssdp:discover"\r\n'
-        "MX: 5\r\n"
+        f"MX: {_SSDP_MX}\r\n"
         f"ST: {search_target}\r\n"
         "\r\n"
     ).encode("utf-8")
 
 
-def _parse_location(response: str) -> str | None:
-    """Extract LOCATION header from SSDP response."""
-    for line in response.split("\r\n"):
-        if line.lower().startswith("location:"):
-            return line.split(":", 1)[1].strip()
-    return None
+# SSDP headers are ASCII by spec, so the LOCATION header is found with a single
+# scan over the raw datagram — no decode, line split or per-line lower().
+_LOCATION_RE = re.compile(rb"\r\nlocation:[ \t]*([^\r\n]+)", re.IGNORECASE)
+
+
+def _parse_location(data: bytes) -> str | None:
+    """Extract LOCATION header from a raw SSDP response datagram."""
+    m = _LOCATION_RE.search(data)
+    if m is None:
+        return None
+    return m.group(1).decode("ascii", errors="ignore").strip() or None
+
+
+def _service_url_base(root, location: str) -> str:
+    """What relative service URLs resolve against: the UPnP 1.0 <URLBase> when
+    the device declares one, otherwise the description's own location."""
+    return _URL_BASE_XP(root).strip() or location
+
+
+def _resolve_url(base: str, ref: str) -> str:
+    """RFC 3986 join of a (possibly relative) service URL; "" stays "".
+
+    Handles absolute URLs, absolute paths and document-relative references
+    ("control", "./scpd.xml") alike, which plain base+path concatenation got
+    wrong for the last kind.
+    """
+    return urljoin(base, ref.strip()) if ref and ref.strip() else ""
 
 
 def _base_url_from_location(location: str) -> str:
     """Extract base URL (scheme + host + port) from a full URL."""
-    from urllib.parse import urlparse
-
     parsed = urlparse(location)
     return f"{parsed.scheme}://{parsed.netloc}"
 
 
-async def _ssdp_search_single(
-    search_target: str, timeout: float = 6.0, source_ip: str | None = None
+class _SsdpProtocol(asyncio.DatagramProtocol):
+    """Collects LOCATION URLs from M-SEARCH replies, deduped, in arrival order.
+
+    Replies are handled on the event loop as they arrive — no executor thread
+    parked in select()/recv() per search.
+    """
+
+    def __init__(self) -> None:
+        self.locations: list[str] = []
+        self._seen: set[str] = set()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        # Only unicast search responses ("HTTP/1.1 200 OK") answer an M-SEARCH;
+        # drop anything else (stray NOTIFY / M-SEARCH) before the header scan.
+        if not data.startswith(b"HTTP/"):
+            return
+        loc = _parse_location(data)
+        if loc and loc not in self._seen:
+            self._seen.add(loc)
+            self.locations.append(loc)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.debug(f"SSDP socket error: {exc}")
+
+
+async def _ssdp_search_interface(
+    search_targets: tuple[str, ...], timeout: float = 6.0, source_ip: str | None = None
 ) -> list[str]:
-    """Send SSDP M-SEARCH for a single ST and collect LOCATION URLs.
+    """M-SEARCH every ST from ONE socket and collect LOCATION URLs.
+
+    All targets are sent back-to-back and share a single reply window, so
+    searching for several STs costs one timeout, not one each.
 
     source_ip binds the socket to a specific local interface (for multi-homed
     hosts). None keeps the default-route behaviour (unchanged).
     """
-    locations: list[str] = []
-    msg = _build_msearch(search_target)
+    msgs = [_build_msearch(st) for st in search_targets]
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.setsockopt(
-        socket.IPPROTO_IP,
-        socket.IP_MULTICAST_TTL,
-        struct.pack("b", 4),
-    )
-    if source_ip:
-        # Send the multicast query out of this specific interface. On failure
-        # (interface gone) the caller treats the whole search as empty.
-        sock.bind((source_ip, 0))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setsockopt(
-            socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(source_ip)
-        )
-    # Keep socket blocking — recv is run in executor thread.
-    # select() provides the timeout; recv() blocks until data arrives.
-    sock.setblocking(True)
-
-    loop = asyncio.get_running_loop()
-
-    # Send M-SEARCH twice for reliability
-    for _ in range(2):
-        await loop.run_in_executor(
-            None, lambda: sock.sendto(msg, (_SSDP_ADDR, _SSDP_PORT))
+            socket.IPPROTO_IP,
+            socket.IP_MULTICAST_TTL,
+            struct.pack("B", _SSDP_TTL),
         )
-        await asyncio.sleep(0.1)
-
-    import select
-
-    def _recv_with_select(s: socket.socket, wait: float) -> bytes | None:
-        """Block up to *wait* seconds for data using select()."""
-        ready, _, _ = select.select([s], [], [], wait)
-        if ready:
-            return s.recv(4096)
-        return None
-
-    deadline = time.monotonic() + timeout
-    while time.monotonic() < deadline:
-        remaining = deadline - time.monotonic()
-        if remaining <= 0:
-            break
-        wait = min(remaining, 1.0)
         try:
-            data = await asyncio.wait_for(
-                loop.run_in_executor(None, _recv_with_select, sock, wait),
-                timeout=wait + 0.5,  # small grace for thread scheduling
-            )
-            if data is None:
-                continue  # select timed out, keep waiting
-            loc = _parse_location(data.decode("utf-8", errors="ignore"))
-            if loc and loc not in locations:
-                locations.append(loc)
-        except (TimeoutError, asyncio.TimeoutError):
-            continue
+            # Replies arrive in a burst when many devices answer at once; a
+            # larger receive buffer keeps the kernel from dropping them before
+            # the loop drains the socket. (Linux clamps this to rmem_max.)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SSDP_RCVBUF)
         except OSError:
-            break
+            pass
+        if source_ip:
+            # Send the multicast query out of this specific interface. On failure
+            # (interface gone) the caller treats the whole search as empty.
+            sock.bind((source_ip, 0))
+            sock.setsockopt(
+                socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(source_ip)
+            )
+        else:
+            # Bind explicitly so the reply port is fixed before the first send.
+            sock.bind(("", 0))
+        sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            _SsdpProtocol, sock=sock
+        )
+    except BaseException:
+        sock.close()
+        raise
 
-    sock.close()
-    return locations
+    try:
+        # Send each M-SEARCH twice for reliability
+        for _ in range(2):
+            for msg in msgs:
+                transport.sendto(msg, (_SSDP_ADDR, _SSDP_PORT))
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+    return protocol.locations
 
 
 def _local_ipv4_addresses() -> list[str]:
@@ -212,23 +319,49 @@ def _local_ipv4_addresses() -> list[str]:
     return addrs
 
 
-async def _ssdp_search(timeout: float = 5.0) -> list[str]:
+# The in-flight search and the timeout it was started with.
+_search_task: tuple[asyncio.Task, float] | None = None
+
+
+async def _ssdp_search(
+    timeout: float = _SSDP_MX + 1.0, force: bool = False
+) -> list[str]:
     """Send SSDP M-SEARCH for MediaRenderer and rootdevice, merge results.
 
     Some devices (e.g. Linn/ohNet) don't respond to the MediaRenderer search
     target but do support AVTransport. Searching for upnp:rootdevice as well
     catches these devices.  Filtering by AVTransport happens later.
 
+    Concurrent callers join the one search already in flight instead of
+    multicasting their own, provided it listens for the same `timeout`. A
+    force=True caller never joins: a search that began before the device set
+    changed could miss the very device that prompted the refresh. Its fresh
+    search becomes the one later callers join.
+    """
+    global _search_task
+    inflight = _search_task
+    if force or inflight is None or inflight[0].done() or inflight[1] != timeout:
+        task = asyncio.ensure_future(_run_ssdp_search(timeout))
+        _search_task = (task, timeout)
+    else:
+        task = inflight[0]
+    # shield: one caller being cancelled mustn't cancel the search for the rest.
+    return list(await asyncio.shield(task))
+
+
+async def _run_ssdp_search(timeout: float) -> list[str]:
+    """One M-SEARCH round over every interface.
+
     Additive multi-interface: always runs the default-route search (unchanged),
     PLUS one search per local interface on multi-homed hosts. Per-interface
     failures are swallowed so they can't break the default path.
     """
     targets = (_SEARCH_TARGET, "upnp:rootdevice")
-    searches = [_ssdp_search_single(st, timeout) for st in targets]  # default route
-    for source_ip in _local_ipv4_addresses():
-        searches.extend(
-            _ssdp_search_single(st, timeout, source_ip=source_ip) for st in targets
-        )
+    searches = [_ssdp_search_interface(targets, timeout)]  # default route
+    searches.extend(
+        _ssdp_search_interface(targets, timeout, source_ip=source_ip)
+        for source_ip in _local_ipv4_addresses()
+    )
 
     results = await asyncio.gather(*searches, return_exceptions=True)
     # Merge and deduplicate; ignore any per-search exception (e.g. an interface
@@ -246,6 +379,19 @@ async def _ssdp_search(timeout: float = 5.0) -> list[str]:
     return locations
 
 
+def _first(nodes: list):
+    """First node of an XPath node-set result, or None when it's empty."""
+    return nodes[0] if nodes else None
+
+
+def _parse_xml(data: bytes):
+    """Parse an untrusted XML document with the hardened parser, or None."""
+    try:
+        return ET.fromstring(data, parser=_XML_PARSER)
+    except ET.XMLSyntaxError:
+        return None
+
+
 async def _fetch_device_description(
     session: aiohttp.ClientSession, location: str
 ) -> DlnaRenderer | None:
@@ -254,54 +400,51 @@ async def _fetch_device_description(
         async with session.get(location, timeout=aiohttp.ClientTimeout(total=5)) as resp:
             if resp.status != 200:
                 return None
-            xml_text = await resp.text()
+            xml_bytes = await resp.read()
     except Exception as e:
         logger.debug(f"Failed to fetch {location}: {e}")
         return None
 
-    try:
-        root = ET.fromstring(xml_text)
-    except (ET.ParseError, DefusedXmlException):
+    root = _parse_xml(xml_bytes)
+    if root is None:
         return None
 
-    device = root.find(f"{{{_NS_DEVICE}}}device")
+    device = _first(_DEVICE_XP(root))
     if device is None:
         logger.debug(f"No <device> element in {location}")
         return None
 
-    friendly_name = device.findtext(f"{{{_NS_DEVICE}}}friendlyName", "")
-    udn = device.findtext(f"{{{_NS_DEVICE}}}UDN", "")
+    friendly_name = _FRIENDLY_NAME_XP(device)
+    udn = _UDN_XP(device)
     if not udn:
         logger.debug(f"No UDN for device '{friendly_name}' at {location}")
         return None
 
     # Identity drives backend-class selection downstream.
-    manufacturer = device.findtext(f"{{{_NS_DEVICE}}}manufacturer", "")
-    model_name = device.findtext(f"{{{_NS_DEVICE}}}modelName", "")
+    manufacturer = _MANUFACTURER_XP(device)
+    model_name = _MODEL_NAME_XP(device)
 
     base_url = _base_url_from_location(location)
+    url_base = _service_url_base(root, location)
     av_control_url = ""
     rc_control_url = ""
     is_openhome = False
 
-    service_list = device.find(f"{{{_NS_DEVICE}}}serviceList")
+    service_list = _first(_SERVICE_LIST_XP(device))
     if service_list is None:
         logger.debug(f"No serviceList for '{friendly_name}' at {location}")
         return None
 
-    for service in service_list.findall(f"{{{_NS_DEVICE}}}service"):
-        service_type = service.findtext(f"{{{_NS_DEVICE}}}serviceType", "")
-        control_url = service.findtext(f"{{{_NS_DEVICE}}}controlURL", "")
-        scpd_url = service.findtext(f"{{{_NS_DEVICE}}}SCPDURL", "")
+    av_scpd_urls: list[str] = []
+    for service in _SERVICE_XP(service_list):
+        service_type = _SERVICE_TYPE_XP(service)
+        control_url = _CONTROL_URL_XP(service)
 
         if service_type == _AVTRANSPORT_TYPE:
-            av_control_url = control_url or ""
-            # Check SCPD for SetNextAVTransportURI support
-            supports_next = await _check_set_next_support(
-                session, base_url, scpd_url or ""
-            )
+            av_control_url = _resolve_url(url_base, control_url)
+            av_scpd_urls.append(_resolve_url(url_base, _SCPD_URL_XP(service)))
         elif service_type == _RENDERING_CONTROL_TYPE:
-            rc_control_url = control_url or ""
+            rc_control_url = _resolve_url(url_base, control_url)
         elif service_type.startswith(_OPENHOME_PLAYLIST_PREFIX):
             # OpenHome services on the renderer's OWN description (some devices
             # combine them); Linn instead puts them on a sibling device, handled
@@ -312,11 +455,12 @@ async def _fetch_device_description(
         logger.debug(f"No AVTransport service for '{friendly_name}' at {location}")
         return None
 
-    # Resolve relative URLs
-    if av_control_url and not av_control_url.startswith("http"):
-        av_control_url = base_url + av_control_url
-    if rc_control_url and not rc_control_url.startswith("http"):
-        rc_control_url = base_url + rc_control_url
+    # SCPD GETs run after the walk (and concurrently), so one slow SCPD no
+    # longer blocks parsing the rest of the service list.
+    checks = await asyncio.gather(
+        *(_check_set_next_support(session, url) for url in av_scpd_urls)
+    )
+    supports_next = any(checks)
 
     return DlnaRenderer(
         name=friendly_name,
@@ -333,33 +477,48 @@ async def _fetch_device_description(
     )
 
 
-async def _check_set_next_support(
-    session: aiohttp.ClientSession, base_url: str, scpd_path: str
-) -> bool:
-    """Check if the AVTransport SCPD lists SetNextAVTransportURI."""
-    if not scpd_path:
+async def _check_set_next_support(session: aiohttp.ClientSession, url: str) -> bool:
+    """Check if the AVTransport SCPD (at absolute `url`) lists SetNextAVTransportURI."""
+    if not url:
         return False
 
-    url = scpd_path if scpd_path.startswith("http") else base_url + scpd_path
     try:
         async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
             if resp.status != 200:
                 return False
-            xml_text = await resp.text()
+            xml_bytes = await resp.read()
     except Exception:
         return False
 
-    try:
-        root = ET.fromstring(xml_text)
-    except (ET.ParseError, DefusedXmlException):
-        return False
+    return _scpd_has_action(xml_bytes, "SetNextAVTransportURI")
 
-    # Search for action name in SCPD
-    for action in root.iter(f"{{{_NS_SERVICE}}}action"):
-        name = action.findtext(f"{{{_NS_SERVICE}}}name", "")
-        if name == "SetNextAVTransportURI":
-            return True
 
+def _scpd_has_action(xml_bytes: bytes, action_name: str) -> bool:
+    """Stream the SCPD's <action> elements and stop at the first match.
+
+    SCPDs can run to tens of KB (every action plus the state-variable table),
+    and only one action name matters, so this never builds the full tree: each
+    action is discarded once checked, and the (often larger) serviceStateTable
+    after the actionList is never parsed at all when the action is present.
+    """
+    actions = ET.iterparse(
+        io.BytesIO(xml_bytes),
+        events=("end",),
+        tag=_SCPD_ACTION_TAG,
+        resolve_entities=False,
+        load_dtd=False,
+        no_network=True,
+    )
+    try:
+        for _, action in actions:
+            if action.findtext(_SCPD_NAME_TAG) == action_name:
+                return True
+            # Free the checked action and any already-seen siblings.
+            action.clear()
+            while action.getprevious() is not None:
+                del action.getparent()[0]
+    except ET.XMLSyntaxError:
+        pass
     return False
 
 
@@ -377,74 +536,87 @@ async def _fetch_openhome_location(
         async with session.get(location, timeout=aiohttp.ClientTimeout(total=5)) as resp:
             if resp.status != 200:
                 return None
-            xml_text = await resp.text()
+            xml_bytes = await resp.read()
     except Exception:
         return None
-    try:
-        root = ET.fromstring(xml_text)
-    except (ET.ParseError, DefusedXmlException):
+    root = _parse_xml(xml_bytes)
+    if root is None:
         return None
-    device = root.find(f"{{{_NS_DEVICE}}}device")
+    device = _first(_DEVICE_XP(root))
     if device is None:
         return None
-    service_list = device.find(f"{{{_NS_DEVICE}}}serviceList")
+    service_list = _first(_SERVICE_LIST_XP(device))
     if service_list is None:
         return None
-    for service in service_list.findall(f"{{{_NS_DEVICE}}}service"):
-        st = service.findtext(f"{{{_NS_DEVICE}}}serviceType", "")
+    for service in _SERVICE_XP(service_list):
+        st = _SERVICE_TYPE_XP(service)
         if st.startswith(_OPENHOME_PLAYLIST_PREFIX):
             host = urlparse(location).hostname or ""
             return (host, location)
     return None
 
 
-async def discover_renderers(force: bool = False) -> list[DlnaRenderer]:
-    """Discover DLNA MediaRenderers on the network.
-
-    Uses a 5-minute cache unless force=True.
-    """
-    global _renderer_cache, _cache_time
-
-    if not force and _renderer_cache and (time.time() - _cache_time) < CACHE_TTL:
-        return _renderer_cache
-
+def _http_session() -> aiohttp.ClientSession:
+    """The shared discovery session, (re)created lazily on the running loop."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # Bounded per host: discovery fans out description + SCPD GETs across
+        # every device at once, and embedded web servers handle few connections.
+        connector = aiohttp.TCPConnector(limit=64, limit_per_host=4, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+    return _session
+
+
+async def close_discovery() -> None:
+    """Close the shared discovery HTTP session (call once at shutdown)."""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+async def _search_renderers(force: bool = False) -> list[DlnaRenderer]:
+    """Run SSDP discovery and fetch every responder's description."""
     logger.info("Starting SSDP discovery for DLNA renderers...")
-    locations = await _ssdp_search()
+    locations = await _ssdp_search(force=force)
     logger.info(f"SSDP found {len(locations)} device location(s)")
 
     renderers: list[DlnaRenderer] = []
-    async with aiohttp.ClientSession() as session:
-        results = await asyncio.gather(
-            *(_fetch_device_description(session, loc) for loc in locations),
-            return_exceptions=True,
-        )
-        for result in results:
-            if isinstance(result, DlnaRenderer):
-                renderers.append(result)
-            elif isinstance(result, Exception):
-                logger.debug(f"Device description fetch failed: {result}")
-
-        # Correlate OpenHome sibling devices (separate root device, same host)
-        # back onto their renderer, so Linn et al. are flagged is_openhome with
-        # a pointer to the OpenHome device description.
-        oh_results = await asyncio.gather(
-            *(_fetch_openhome_location(session, loc) for loc in locations),
-            return_exceptions=True,
-        )
-        oh_by_host: dict[str, str] = {}
-        for oh in oh_results:
-            if isinstance(oh, tuple):
-                host, oh_loc = oh
-                oh_by_host.setdefault(host, oh_loc)
-
-    for r in renderers:
+    session = _http_session()
+    # Description and OpenHome probes don't depend on each other, so both run
+    # in one gather: discovery costs the slowest fetch, not two rounds of it.
+    # The shared connector's limits bound how many are actually in flight.
+    results = await asyncio.gather(
+        *(_fetch_device_description(session, loc) for loc in locations),
+        *(_fetch_openhome_location(session, loc) for loc in locations),
+        return_exceptions=True,
+    )
+    desc_results, oh_results = results[: len(locations)], results[len(locations):]
+    for result in desc_results:
+        if isinstance(result, DlnaRenderer):
+            renderers.append(result)
+        elif isinstance(result, Exception):
+            logger.debug(f"Device description fetch failed: {result}")
+
+    # Correlate OpenHome sibling devices (separate root device, same host)
+    # back onto their renderer, so Linn et al. are flagged is_openhome with
+    # a pointer to the OpenHome device description.
+    oh_by_host: dict[str, str] = {}
+    for oh in oh_results:
+        if isinstance(oh, tuple):
+            host, oh_loc = oh
+            oh_by_host.setdefault(host, oh_loc)
+
+    for i, r in enumerate(renderers):
         host = urlparse(r.location).hostname or ""
         if host in oh_by_host:
-            r.is_openhome = True
-            r.openhome_location = oh_by_host[host]
+            renderers[i] = replace(
+                r, is_openhome=True, openhome_location=oh_by_host[host]
+            )
 
-    _renderer_cache = renderers
-    _cache_time = time.time()
     logger.info(
         f"Discovered {len(renderers)} renderer(s): "
         + ", ".join(
@@ -455,9 +627,297 @@ async def discover_renderers(force: bool = False) -> list[DlnaRenderer]:
     return renderers
 
 
-async def find_renderer(name: str) -> DlnaRenderer | None:
-    """Find a renderer by case-insensitive substring match on friendly name."""
-    return _match_by_name(await discover_renderers(), name)
+class _NameIndex:
+    """Friendly-name lookup over a device list with the names case-folded once.
+
+    Same contract as the linear scan it replaces: exact (case-insensitive) match
+    first, then the first substring match, in list order.
+    """
+
+    __slots__ = ("_exact", "_folded")
+
+    def __init__(self, devices: list) -> None:
+        self._folded = [(d.name.casefold(), d) for d in devices]
+        self._exact: dict[str, object] = {}
+        for folded, d in self._folded:
+            self._exact.setdefault(folded, d)  # first wins, as in the scan
+
+    def match(self, name: str):
+        key = name.casefold()
+        found = self._exact.get(key)
+        if found is not None:
+            return found
+        return next((d for folded, d in self._folded if key in folded), None)
+
+
+# Bumped on every cache mutation. The renderer list and its name index are
+# rebuilt only when it (or the cache dict itself) changes, so repeat tool calls
+# reuse one list + index instead of re-listing and re-folding every name.
+_cache_version = 0
+_snapshot: tuple[dict, int, list[DlnaRenderer], _NameIndex] | None = None
+
+
+def _renderer_snapshot() -> tuple[list[DlnaRenderer], _NameIndex]:
+    global _snapshot
+    snap = _snapshot
+    if snap is None or snap[0] is not _renderer_cache or snap[1] != _cache_version:
+        renderers = [r for r, _ in _renderer_cache.values()]
+        snap = (_renderer_cache, _cache_version, renderers, _NameIndex(renderers))
+        _snapshot = snap
+    return snap[2], snap[3]
+
+
+# Called with every renderer the cache evicts (byebye, TTL expiry, a forced
+# rescan that no longer sees it), so holders of per-device state can drop it on
+# every transport: queue_manager registers the ControlPoint's device-tree cache.
+_eviction_hooks: list[Callable[[DlnaRenderer], None]] = []
+
+
+def on_renderer_evicted(hook: Callable[[DlnaRenderer], None]) -> None:
+    """Register `hook(renderer)` to run whenever a renderer leaves the cache."""
+    if hook not in _eviction_hooks:
+        _eviction_hooks.append(hook)
+
+
+def _evicted(renderers) -> None:
+    for r in renderers:
+        for hook in _eviction_hooks:
+            try:
+                hook(r)
+            except Exception as e:  # noqa: BLE001 - a hook must not break discovery
+                logger.debug(f"Eviction hook failed for {r.udn}: {e}")
+
+
+def _store_renderers(renderers: list[DlnaRenderer], replace: bool) -> None:
+    """Record a search result. replace=False merges, so a renderer that missed
+    one search (lost UDP reply) lingers until its own entry expires."""
+    global _renderer_cache, _cache_time, _cache_version
+    now = time.time()
+    if replace:
+        seen = {r.udn for r in renderers}
+        _evicted(r for udn, (r, _) in _renderer_cache.items() if udn not in seen)
+        _renderer_cache = {}
+    for r in renderers:
+        _renderer_cache[r.udn] = (r, now)
+    _cache_time = now
+    _cache_version += 1
+
+
+def _live_renderers(now: float) -> list[DlnaRenderer]:
+    """Cached renderers younger than CACHE_TTL (pruning the expired ones).
+
+    Returns the shared snapshot list — callers must not mutate it.
+    """
+    global _cache_version
+    expired = [udn for udn, (_, ts) in _renderer_cache.items() if now - ts >= CACHE_TTL]
+    if expired:
+        _evicted([_renderer_cache.pop(udn)[0] for udn in expired])
+        _cache_version += 1
+    return _renderer_snapshot()[0]
+
+
+# ---------------------------------------------------------------------------
+# Persisted renderer cache (so a fresh process answers without an SSDP wait)
+# ---------------------------------------------------------------------------
+
+_DISK_CACHE_VERSION = 1
+# A renderer loaded from disk is seeded this many seconds short of expiry, so it
+# is served immediately while the refresh-ahead search replaces it.
+_DISK_SEED_FRESH_SECS = 10
+# Budget for the liveness probe of each loaded renderer.
+_DISK_PROBE_TIMEOUT = 1.5
+_disk_cache_loaded = False
+
+
+def _disk_cache_enabled() -> bool:
+    return os.getenv("RENFIELD_DISK_CACHE") != "0"
+
+
+def _disk_cache_path() -> str:
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "renfield-mcp-dlna", "renderers.json")
+
+
+# uuid.getnode() sets this (the multicast bit) on the random number it returns
+# when no hardware MAC is readable, as is common in containers.
+_RANDOM_NODE_BIT = 0x010000000000
+
+
+def _network_id() -> str:
+    """Identify the attached network (host MAC + local IPv4s), so a cache written
+    on a different network — a moved laptop, a re-homed container — is ignored.
+
+    A random node (no readable MAC) would change every process start and never
+    match, so the id then falls back to the local IPv4s alone.
+    """
+    ips = ",".join(sorted(_local_ipv4_addresses()))
+    node = uuid.getnode()
+    if node & _RANDOM_NODE_BIT:
+        return f"-|{ips}"
+    return f"{node:012x}|{ips}"
+
+
+def _write_disk_cache(entries: list[dict]) -> None:
+    """Atomically replace the cache file (blocking; run in a worker thread)."""
+    path = _disk_cache_path()
+    payload = {
+        "version": _DISK_CACHE_VERSION,
+        "network_id": _network_id(),
+        "renderers": entries,
+    }
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Unique temp name: concurrent saves (threads or processes) never share one.
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".renderers.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _read_disk_cache() -> list[DlnaRenderer]:
+    """Renderers from the cache file, or [] if absent/corrupt/other network."""
+    try:
+        with open(_disk_cache_path(), encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.debug(f"Ignoring unreadable renderer cache: {e}")
+        return []
+    if (
+        not isinstance(payload, dict)
+        or payload.get("version") != _DISK_CACHE_VERSION
+        or payload.get("network_id") != _network_id()
+    ):
+        return []
+    types = {f.name: f.type for f in fields(DlnaRenderer)}
+    renderers: list[DlnaRenderer] = []
+    for entry in payload.get("renderers") or []:
+        if not isinstance(entry, dict):
+            continue
+        kwargs = {k: v for k, v in entry.items() if k in types}
+        if not all(isinstance(v, types[k]) for k, v in kwargs.items()):
+            continue  # e.g. a numeric name would break name matching later
+        try:
+            renderers.append(DlnaRenderer(**kwargs))
+        except TypeError:
+            continue  # missing required field — skip it, keep the rest
+    return renderers
+
+
+async def _save_disk_cache() -> None:
+    if not _disk_cache_enabled():
+        return
+    entries = [asdict(r) for r in _renderer_snapshot()[0]]
+    if not entries:
+        return  # an empty search (e.g. a network blip) must not wipe the file
+    try:
+        await asyncio.to_thread(_write_disk_cache, entries)
+    except OSError as e:
+        logger.debug(f"Could not persist renderer cache: {e}")
+
+
+async def _is_reachable(location: str) -> bool:
+    """Any HTTP answer (even a 405 to HEAD) means the device is still there."""
+    try:
+        async with _http_session().head(
+            location, timeout=aiohttp.ClientTimeout(total=_DISK_PROBE_TIMEOUT)
+        ):
+            return True
+    except Exception:  # noqa: BLE001 - unreachable for whatever reason
+        return False
+
+
+async def _load_disk_cache() -> None:
+    """Seed the in-memory cache from disk, once per process, keeping only the
+    renderers that still answer at their description URL."""
+    global _disk_cache_loaded, _cache_time, _cache_version
+    if _disk_cache_loaded:
+        return
+    _disk_cache_loaded = True
+    if not _disk_cache_enabled():
+        return
+    renderers = await asyncio.to_thread(_read_disk_cache)
+    if not renderers:
+        return
+    alive = await asyncio.gather(*(_is_reachable(r.location) for r in renderers))
+    seeded_at = time.time() - CACHE_TTL + _DISK_SEED_FRESH_SECS
+    seeded = 0
+    for r, ok in zip(renderers, alive, strict=True):
+        if ok and r.udn not in _renderer_cache:
+            _renderer_cache[r.udn] = (r, seeded_at)
+            seeded += 1
+    if seeded:
+        if not _cache_time:
+            _cache_time = seeded_at
+        _cache_version += 1
+        logger.info(f"Seeded {seeded} renderer(s) from {_disk_cache_path()}")
+
+
+async def _refresh_renderers() -> None:
+    try:
+        _store_renderers(await _search_renderers(), replace=False)
+        await _save_disk_cache()
+    except Exception as e:  # noqa: BLE001 - background refresh is best-effort
+        logger.debug(f"Background renderer refresh failed: {e}")
+
+
+def _schedule_refresh() -> None:
+    """Start a background renderer search unless one is already running."""
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(_refresh_renderers())
+
+
+def invalidate_renderer(udn: str) -> None:
+    """Forget one cached renderer (e.g. on its ssdp:byebye), leaving the rest."""
+    global _cache_version
+    entry = _renderer_cache.pop(udn, None)
+    if entry is not None:
+        _cache_version += 1
+        _evicted([entry[0]])
+        logger.info(f"Renderer {udn} left the network; dropped from cache")
+
+
+async def discover_renderers(force: bool = False) -> list[DlnaRenderer]:
+    """Discover DLNA MediaRenderers on the network.
+
+    Served from the cache unless force=True or nothing cached is younger than
+    CACHE_TTL; a cache nearing expiry is refreshed in the background. The
+    first call in a process can be served from the last run's persisted list.
+    """
+    if not force:
+        await _load_disk_cache()
+        now = time.time()
+        live = _live_renderers(now)
+        if live:
+            if now - _cache_time >= CACHE_TTL - REFRESH_AHEAD_SECS:
+                _schedule_refresh()
+            return live
+
+    _store_renderers(await _search_renderers(force=force), replace=force)
+    await _save_disk_cache()
+    return _live_renderers(time.time())
+
+
+async def find_renderer(name: str, refresh: bool = False) -> DlnaRenderer | None:
+    """Find a renderer by case-insensitive substring match on friendly name.
+
+    Served from the TTL cache (see discover_renderers) — repeat tool calls never
+    wait on SSDP while it's fresh. refresh=True forces a new search first.
+    """
+    renderers = await discover_renderers(force=refresh)
+    cached, index = _renderer_snapshot()
+    if renderers is not cached:  # not served from the cache (e.g. patched)
+        index = _NameIndex(renderers)
+    return index.match(name)
 
 
 # ---------------------------------------------------------------------------
@@ -474,43 +934,41 @@ async def _fetch_server_description(
         async with session.get(location, timeout=aiohttp.ClientTimeout(total=5)) as resp:
             if resp.status != 200:
                 return None
-            xml_text = await resp.text()
+            xml_bytes = await resp.read()
     except Exception as e:
         logger.debug(f"Failed to fetch {location}: {e}")
         return None
 
-    try:
-        root = ET.fromstring(xml_text)
-    except (ET.ParseError, DefusedXmlException):
+    root = _parse_xml(xml_bytes)
+    if root is None:
         return None
 
-    device = root.find(f"{{{_NS_DEVICE}}}device")
+    device = _first(_DEVICE_XP(root))
     if device is None:
         return None
 
-    udn = device.findtext(f"{{{_NS_DEVICE}}}UDN", "")
+    udn = _UDN_XP(device)
     if not udn:
         return None
-    friendly_name = device.findtext(f"{{{_NS_DEVICE}}}friendlyName", "")
-    manufacturer = device.findtext(f"{{{_NS_DEVICE}}}manufacturer", "")
-    model_name = device.findtext(f"{{{_NS_DEVICE}}}modelName", "")
+    friendly_name = _FRIENDLY_NAME_XP(device)
+    manufacturer = _MANUFACTURER_XP(device)
+    model_name = _MODEL_NAME_XP(device)
     base_url = _base_url_from_location(location)
+    url_base = _service_url_base(root, location)
 
-    service_list = device.find(f"{{{_NS_DEVICE}}}serviceList")
+    service_list = _first(_SERVICE_LIST_XP(device))
     if service_list is None:
         return None
 
     cd_control_url = ""
-    for service in service_list.findall(f"{{{_NS_DEVICE}}}service"):
-        service_type = service.findtext(f"{{{_NS_DEVICE}}}serviceType", "")
+    for service in _SERVICE_XP(service_list):
+        service_type = _SERVICE_TYPE_XP(service)
         if service_type.startswith(_CONTENT_DIRECTORY_PREFIX):
-            cd_control_url = service.findtext(f"{{{_NS_DEVICE}}}controlURL", "") or ""
+            cd_control_url = _resolve_url(url_base, _CONTROL_URL_XP(service))
             break
 
     if not cd_control_url:
         return None  # not a MediaServer
-    if not cd_control_url.startswith("http"):
-        cd_control_url = base_url + cd_control_url
 
     return DlnaServer(
         name=friendly_name,
@@ -531,17 +989,17 @@ async def discover_servers(force: bool = False) -> list[DlnaServer]:
         return _server_cache
 
     logger.info("Starting SSDP discovery for DLNA servers...")
-    locations = await _ssdp_search()
+    locations = await _ssdp_search(force=force)
 
     servers: list[DlnaServer] = []
-    async with aiohttp.ClientSession() as session:
-        tasks = [_fetch_server_description(session, loc) for loc in locations]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for result in results:
-            if isinstance(result, DlnaServer):
-                servers.append(result)
-            elif isinstance(result, Exception):
-                logger.debug(f"Server description fetch failed: {result}")
+    session = _http_session()
+    tasks = [_fetch_server_description(session, loc) for loc in locations]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, DlnaServer):
+            servers.append(result)
+        elif isinstance(result, Exception):
+            logger.debug(f"Server description fetch failed: {result}")
 
     _server_cache = servers
     _server_cache_time = time.time()
@@ -552,18 +1010,15 @@ async def discover_servers(force: bool = False) -> list[DlnaServer]:
     return servers
 
 
+# Name index over the server list it was built from; rebuilt only when
+# discover_servers hands back a different list (i.e. after a rescan).
+_server_index: tuple[list[DlnaServer], _NameIndex] | None = None
+
+
 async def find_server(name: str) -> DlnaServer | None:
     """Find a MediaServer by case-insensitive substring match on friendly name."""
-    return _match_by_name(await discover_servers(), name)
-
-
-def _match_by_name(devices: list, name: str):
-    """Exact (case-insensitive) match first, then substring, on .name."""
-    name_lower = name.lower()
-    for d in devices:
-        if d.name.lower() == name_lower:
-            return d
-    for d in devices:
-        if name_lower in d.name.lower():
-            return d
-    return None
+    global _server_index
+    servers = await discover_servers()
+    if _server_index is None or _server_index[0] is not servers:
+        _server_index = (servers, _NameIndex(servers))
+    return _server_index[1].match(name)
@@ -20,15 +20,20 @@ Auto-advance / gapless state machine (driven by _on_transport_event):
 
   "played" = the renderer's PRIOR reported state was PLAYING/PAUSED (_prev_transport_state),
   so a transient STOPPED during buffering — or after a TRANSITIONING — is never read as track-end.
+
+  The actions an event triggers (_preload_next / _auto_advance / _cleanup) are
+  queued via _dispatch and run serially, in event order, on one drain task.
 """
 
 import asyncio
 import logging
 import os
 import time
+from collections import deque
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 
-from . import metadata
+from . import discovery, metadata
 from .backends import (
     AvTransportBackend,
     OpenHomeBackend,
@@ -54,7 +59,17 @@ _PLAYBACK_CONFIRM_INTERVAL = 0.5
 _default_control_point = ControlPoint()
 
 
-@dataclass
+def _forget_evicted_renderer(renderer: DlnaRenderer) -> None:
+    """Discovery evicted `renderer`: drop its parsed device trees so the next
+    session re-fetches them (a restarted device may have changed)."""
+    locations = (renderer.openhome_location,) if renderer.openhome_location else ()
+    _default_control_point.forget_device(renderer.udn, *locations)
+
+
+discovery.on_renderer_evicted(_forget_evicted_renderer)
+
+
+@dataclass(slots=True, frozen=True)
 class Track:
     """A single track in the playback queue."""
 
@@ -132,6 +147,34 @@ class QueueSession:
         # the same track don't rebuild it (keyed by URL within this session =
         # the (url, UDN) key from the plan, since a session is one renderer).
         self._metadata_cache: dict[str, str] = {}
+        # Queue consequences of transport events (preload / auto-advance /
+        # cleanup) run one at a time, in event order, on a single drain task
+        # started on demand — not a fresh Task per event, and never two of them
+        # interleaving their device I/O.
+        self._pending: deque[Callable[[], Awaitable[None]]] = deque()
+        self._drain_task: asyncio.Task | None = None
+
+    def _dispatch(self, action: Callable[[], Awaitable[None]]) -> None:
+        """Queue an event-driven action for the drain task (sync, no await)."""
+        self._pending.append(action)
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending:
+            action = self._pending.popleft()
+            try:
+                await action()
+            except Exception as e:  # noqa: BLE001 - one failure mustn't wedge the queue
+                logger.error(f"[{self.renderer.name}] Event action failed: {e}")
+
+    def _cancel_pending(self) -> None:
+        """Drop queued event actions and stop the drain task (unless we're on it)."""
+        self._pending.clear()
+        task = self._drain_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+        self._drain_task = None
 
     def _build_metadata(self, track: Track) -> str:
         """Build (and memoise) DIDL-Lite metadata via the device-family strategy."""
@@ -285,7 +328,7 @@ class QueueSession:
                     f"{self.current_index + 1}/{len(self.tracks)}: "
                     f"{preloaded_track.title}"
                 )
-                asyncio.create_task(self._preload_next())
+                self._dispatch(self._preload_next)
                 return
 
         # Track end for renderers WITHOUT SetNext: when transport stops AFTER
@@ -300,7 +343,7 @@ class QueueSession:
         ):
             logger.info(f"[{self.renderer.name}] Track ended (no gapless), advancing...")
             self._advancing = True
-            asyncio.create_task(self._auto_advance())
+            self._dispatch(self._auto_advance)
             return
 
         # Album finished — only after the last track actually played (guards
@@ -311,7 +354,7 @@ class QueueSession:
             and self.current_index >= len(self.tracks) - 1
         ):
             logger.info(f"[{self.renderer.name}] Queue finished")
-            asyncio.create_task(self._cleanup())
+            self._dispatch(self._cleanup)
 
     async def _auto_advance(self) -> None:
         """Advance to next track on renderers without SetNext (small gap)."""
@@ -398,6 +441,7 @@ class QueueSession:
 
     async def stop(self) -> None:
         """Stop playback, unsubscribe, cleanup."""
+        self._cancel_pending()
         await self.backend.disconnect()
         logger.info(f"[{self.renderer.name}] Stopped and cleaned up")
         await self._cleanup()
@@ -517,6 +561,21 @@ def get_session(udn: str) -> QueueSession | None:
     return _default_control_point.get_session(udn)  # type: ignore[return-value]
 
 
+def find_session_by_name(name: str) -> QueueSession | None:
+    """Active session whose renderer's friendly name equals `name`
+    (case-insensitive), without touching discovery.
+
+    Exact match only: a substring hit among the few *active* sessions could
+    shadow a better (exact) match among all renderers, so partial names still
+    resolve through discovery.find_renderer.
+    """
+    key = name.casefold()
+    for session in _default_control_point.sessions.values():
+        if session.renderer.name.casefold() == key:
+            return session  # type: ignore[return-value]
+    return None
+
+
 def get_all_sessions() -> dict[str, QueueSession]:
     """Get all active sessions (from the default control point)."""
     return _default_control_point.get_all_sessions()  # type: ignore[return-value]
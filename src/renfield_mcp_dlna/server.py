@@ -1,5 +1,6 @@
 """FastMCP server for DLNA media renderer control."""
 
+import asyncio
 import json
 import logging
 import os
@@ -7,6 +8,11 @@ import sys
 
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import orjson  # optional C parser for large `tracks` payloads (.[fast])
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
 from . import discovery, mediaserver, queue_manager
 from .queue_manager import Track
 
@@ -44,6 +50,17 @@ def _error(message: str) -> dict:
     return {"success": False, "error": message}
 
 
+def _loads_json(text):
+    """Parse a JSON tool argument — orjson when installed, else stdlib.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch
+    one exception type either way.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
 async def _resolve_renderer(renderer_name: str):
     """Find a renderer by (partial) name or raise ToolError. Patchable via
     discovery.find_renderer (kept as the indirection point tests mock)."""
@@ -55,7 +72,13 @@ async def _resolve_renderer(renderer_name: str):
 
 async def _resolve_session(renderer_name: str):
     """Resolve (renderer, active session) or raise ToolError if either is
-    missing. Used by every tool that acts on in-progress playback."""
+    missing. Used by every tool that acts on in-progress playback.
+
+    A name that exactly matches an active session's renderer is served from the
+    session registry, skipping the discovery cache + name scan."""
+    session = queue_manager.find_session_by_name(renderer_name)
+    if session is not None:
+        return session.renderer, session
     renderer = await _resolve_renderer(renderer_name)
     session = queue_manager.get_session(renderer.udn)
     if not session:
@@ -120,7 +143,7 @@ async def play_tracks(
         return _error(str(e))
 
     try:
-        track_list_raw = json.loads(tracks)
+        track_list_raw = _loads_json(tracks)
     except (json.JSONDecodeError, TypeError) as e:
         return _error(f"Invalid tracks JSON: {e}")
 
@@ -305,13 +328,16 @@ async def set_play_mode(renderer_name: str, mode: str) -> dict:
 @mcp.tool()
 async def get_status(renderer_name: str) -> dict:
     """Get current playback status, track info, and queue position."""
-    try:
-        renderer = await _resolve_renderer(renderer_name)
-    except ToolError as e:
-        return _error(str(e))
-
-    # No session is not an error here — an idle renderer is a valid status.
-    session = queue_manager.get_session(renderer.udn)
+    session = queue_manager.find_session_by_name(renderer_name)
+    if session is None:
+        try:
+            renderer = await _resolve_renderer(renderer_name)
+        except ToolError as e:
+            return _error(str(e))
+        # No session is not an error here — an idle renderer is a valid status.
+        session = queue_manager.get_session(renderer.udn)
+    else:
+        renderer = session.renderer
     if not session:
         return {
             "renderer": renderer.name,
@@ -523,9 +549,13 @@ async def play_from_server(
 
 async def _refresh_discovery_caches() -> None:
     """Force-refresh the renderer + server caches (called by the SSDP listener
-    when the device set changes)."""
-    await discovery.discover_renderers(force=True)
-    await discovery.discover_servers(force=True)
+    when the device set changes). Run concurrently, so the refresh costs one
+    scan window; each forced search starts fresh rather than joining one that
+    predates the change."""
+    await asyncio.gather(
+        discovery.discover_renderers(force=True),
+        discovery.discover_servers(force=True),
+    )
 
 
 async def _serve_streamable_http() -> None:
@@ -537,13 +567,24 @@ async def _serve_streamable_http() -> None:
     little from a persistent multicast listener.
     """
     cp = queue_manager._default_control_point
-    await cp.start_discovery_listener(_refresh_discovery_caches)
+    await cp.start_discovery_listener(
+        _refresh_discovery_caches, on_byebye=discovery.invalidate_renderer
+    )
     await cp.start_session_watchdog()
     try:
         await mcp.run_streamable_http_async()
     finally:
         await cp.stop_background_tasks()
         await cp.aclose()
+        await discovery.close_discovery()
+
+
+async def _serve_stdio() -> None:
+    """Run the stdio transport, closing the discovery HTTP session on exit."""
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await discovery.close_discovery()
 
 
 def main():
@@ -561,10 +602,9 @@ def main():
         logger.info(
             f"Starting DLNA MCP server on {mcp.settings.host}:{mcp.settings.port} (streamable-http)"
         )
-        import asyncio
         asyncio.run(_serve_streamable_http())
     else:
-        mcp.run(transport="stdio")
+        asyncio.run(_serve_stdio())
 
 
 if __name__ == "__main__":
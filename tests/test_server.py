@@ -2,8 +2,11 @@
 
 import asyncio
 import json
+import os
+from contextlib import contextmanager
+from dataclasses import asdict
 from datetime import timedelta
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 
 import pytest
 from async_upnp_client.profiles.dlna import PlayMode
@@ -20,6 +23,14 @@ from renfield_mcp_dlna.discovery import DlnaRenderer, DlnaServer
 from renfield_mcp_dlna.queue_manager import QueueSession, Track
 
 
+@pytest.fixture(autouse=True)
+def _isolated_disk_cache(monkeypatch, tmp_path):
+    """Keep the persisted renderer cache out of the real ~/.cache, and let each
+    test start as a fresh process that hasn't loaded it yet."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg-cache"))
+    monkeypatch.setattr(discovery, "_disk_cache_loaded", False)
+
+
 def _make_server(name: str = "Jellyfin", udn: str = "uuid:srv-1") -> DlnaServer:
     return DlnaServer(
         name=name,
@@ -70,16 +81,17 @@ def _make_renderer(
     name: str = "HiFiBerry Garten",
     udn: str = "uuid:test-1234",
     supports_next: bool = True,
+    **overrides,
 ) -> DlnaRenderer:
-    return DlnaRenderer(
-        name=name,
-        udn=udn,
-        location="http://192.168.1.100:49152/description.xml",
-        supports_next=supports_next,
-        av_transport_control_url="http://192.168.1.100:49152/AVTransport/control",
-        rendering_control_url="http://192.168.1.100:49152/RenderingControl/control",
-        base_url="http://192.168.1.100:49152",
-    )
+    """DlnaRenderer is frozen, so tests set any other field via `overrides`."""
+    attrs = {
+        "location": "http://192.168.1.100:49152/description.xml",
+        "av_transport_control_url": "http://192.168.1.100:49152/AVTransport/control",
+        "rendering_control_url": "http://192.168.1.100:49152/RenderingControl/control",
+        "base_url": "http://192.168.1.100:49152",
+    }
+    attrs.update(overrides)
+    return DlnaRenderer(name=name, udn=udn, supports_next=supports_next, **attrs)
 
 
 def _make_tracks(count: int = 3) -> list[Track]:
@@ -94,6 +106,42 @@ def _make_tracks(count: int = 3) -> list[Track]:
     ]
 
 
+# Shared read-only queues for tests that only inspect tracks. Track is frozen
+# and the containers are tuples, so no test can leak state into another.
+_TRACKS_3 = tuple(_make_tracks(3))
+_TRACKS_5 = tuple(_make_tracks(5))
+
+
+class _StubSession:
+    """Plain stand-in for a QueueSession in server-tool tests.
+
+    Cheaper than MagicMock(spec=QueueSession): it carries only the surface the
+    tools touch. Tests override individual methods (return_value / side_effect)
+    as needed.
+    """
+
+    def __init__(self):
+        self.renderer = _make_renderer()
+        self.tracks = ()
+        self.current_index = 0
+        self.status = MagicMock(return_value={})
+        for name in ("stop", "next", "previous", "pause", "resume", "seek",
+                     "set_volume", "get_volume", "set_mute", "get_mute",
+                     "set_play_mode", "refresh_state"):
+            setattr(self, name, AsyncMock())
+
+
+@contextmanager
+def _patch_resolve(renderer: DlnaRenderer, session=None):
+    """Patch the two lookups behind server._resolve_session in one place:
+    discovery finds `renderer`, queue_manager hands back `session`."""
+    with (
+        patch.multiple(discovery, find_renderer=AsyncMock(return_value=renderer)),
+        patch.multiple(queue_manager, get_session=MagicMock(return_value=session)),
+    ):
+        yield
+
+
 _RC_TYPE = "urn:schemas-upnp-org:service:RenderingControl:1"
 
 
@@ -166,6 +214,53 @@ class TestBuildDidlMetadata:
         # Should parse without error
         ET.fromstring(xml)
 
+    @pytest.mark.parametrize(("url", "kwargs"), [
+        ("http://example.com/t.flac?id=1&fmt=<raw>", {}),
+        ("http://example.com/t.flac", {"title": "Cold as Ice", "artist": "Foreigner",
+                                       "album": "Best Of"}),
+        ("http://example.com/t.flac", {"title": 'R&B <"Live">', "artist": "A&B",
+                                       "album": "<x>", "art_url": "http://art/c.jpg?a=1&b=2"}),
+        ("http://example.com/t.mp3", {"mime_type": "audio/mpeg",
+                                      "dlna_features": 'DLNA.ORG_PN=MP3;X="1"\t'}),
+        # Non-ASCII: didl_lite serialises us-ascii, so these become &#NNN; refs.
+        ("http://example.com/K\u00fcche.flac", {"title": "K\u00fcche", "artist": "Bj\u00f6rk",
+                                            "album": "\u65e5\u672c \U0001f600"}),
+        # Empty fields: no url self-closes <res/>; empty optionals are omitted.
+        ("", {"title": "", "artist": "", "album": "", "art_url": ""}),
+    ])
+    def test_template_matches_didl_lite(self, url, kwargs):
+        """The string template must stay byte-identical to didl_lite's output."""
+        from didl_lite import didl_lite
+
+        res = didl_lite.Resource(
+            uri=url,
+            protocol_info=f"http-get:*:{kwargs.get('mime_type', 'audio/flac')}:"
+            f"{kwargs.get('dlna_features', '*')}",
+        )
+        opt = {k2: kwargs[k1] for k1, k2 in
+               (("artist", "creator"), ("album", "album"), ("art_url", "album_art_uri"))
+               if kwargs.get(k1)}
+        item = didl_lite.MusicTrack(
+            id="0", parent_id="-1", title=kwargs.get("title") or "Unknown",
+            restricted="1", resources=[res], **opt,
+        )
+        expected = didl_lite.to_xml_string(item).decode("utf-8")
+        assert build_didl_metadata(url, **kwargs) == expected
+
+    @pytest.mark.parametrize(("url", "title"), [
+        ("http://v/m.mkv", "Am\u00e9lie"), ("", ""), ("http://v/a&b", "<Alien>"),
+    ])
+    def test_video_template_matches_didl_lite(self, url, title):
+        from didl_lite import didl_lite
+
+        from renfield_mcp_dlna.didl import build_video_didl_metadata
+
+        res = didl_lite.Resource(uri=url, protocol_info="http-get:*:video/mp4:*")
+        item = didl_lite.Movie(id="0", parent_id="-1", title=title or "Unknown",
+                               restricted="1", resources=[res])
+        expected = didl_lite.to_xml_string(item).decode("utf-8")
+        assert build_video_didl_metadata(url, title) == expected
+
 
 # ---------------------------------------------------------------------------
 # Discovery Tests
@@ -174,46 +269,232 @@ class TestBuildDidlMetadata:
 class TestFindRenderer:
     @pytest.fixture(autouse=True)
     def _clear_cache(self):
-        discovery._renderer_cache = []
+        discovery._renderer_cache = {}
         discovery._cache_time = 0
         yield
-        discovery._renderer_cache = []
+        discovery._renderer_cache = {}
         discovery._cache_time = 0
 
+    @pytest.fixture(autouse=True)
+    def discover(self):
+        """One discover_renderers mock per test; tests swap return_value."""
+        mock = AsyncMock(return_value=[_make_renderer(name="HiFiBerry Garten")])
+        with patch.object(discovery, "discover_renderers", mock):
+            yield mock
+
     async def test_exact_match(self):
-        renderers = [_make_renderer(name="HiFiBerry Garten")]
-        with patch.object(discovery, "discover_renderers", new_callable=AsyncMock, return_value=renderers):
-            result = await discovery.find_renderer("HiFiBerry Garten")
-            assert result is not None
-            assert result.name == "HiFiBerry Garten"
+        result = await discovery.find_renderer("HiFiBerry Garten")
+        assert result is not None
+        assert result.name == "HiFiBerry Garten"
 
     async def test_case_insensitive_match(self):
-        renderers = [_make_renderer(name="HiFiBerry Garten")]
-        with patch.object(discovery, "discover_renderers", new_callable=AsyncMock, return_value=renderers):
-            result = await discovery.find_renderer("hifiberry garten")
-            assert result is not None
+        result = await discovery.find_renderer("hifiberry garten")
+        assert result is not None
 
     async def test_substring_match(self):
-        renderers = [_make_renderer(name="HiFiBerry Garten")]
-        with patch.object(discovery, "discover_renderers", new_callable=AsyncMock, return_value=renderers):
-            result = await discovery.find_renderer("Garten")
-            assert result is not None
+        result = await discovery.find_renderer("Garten")
+        assert result is not None
 
     async def test_not_found(self):
-        renderers = [_make_renderer(name="HiFiBerry Garten")]
-        with patch.object(discovery, "discover_renderers", new_callable=AsyncMock, return_value=renderers):
-            result = await discovery.find_renderer("Nonexistent")
-            assert result is None
+        result = await discovery.find_renderer("Nonexistent")
+        assert result is None
 
-    async def test_exact_match_preferred_over_substring(self):
-        renderers = [
+    async def test_exact_match_preferred_over_substring(self, discover):
+        discover.return_value = [
             _make_renderer(name="Samsung TV", udn="uuid:tv"),
             _make_renderer(name="Samsung TV Living Room", udn="uuid:tv-lr"),
         ]
-        with patch.object(discovery, "discover_renderers", new_callable=AsyncMock, return_value=renderers):
-            result = await discovery.find_renderer("Samsung TV")
-            assert result is not None
-            assert result.udn == "uuid:tv"
+        result = await discovery.find_renderer("Samsung TV")
+        assert result is not None
+        assert result.udn == "uuid:tv"
+
+
+class TestDiscoveryHttpSession:
+    async def test_session_is_reused_until_closed(self):
+        first = discovery._http_session()
+        assert discovery._http_session() is first
+        await discovery.close_discovery()
+        assert first.closed
+        second = discovery._http_session()
+        assert second is not first
+        await discovery.close_discovery()
+
+
+class TestRendererCache:
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        discovery._renderer_cache = {}
+        discovery._cache_time = 0
+        yield
+        discovery._renderer_cache = {}
+        discovery._cache_time = 0
+
+    def _seed(self, age: float, *renderers):
+        ts = discovery.time.time() - age
+        for r in renderers:
+            discovery._renderer_cache[r.udn] = (r, ts)
+        discovery._cache_time = ts
+
+    async def test_fresh_cache_skips_search(self, monkeypatch):
+        search = AsyncMock()
+        monkeypatch.setattr(discovery, "_search_renderers", search)
+        self._seed(0, _make_renderer())
+        assert [r.udn for r in await discovery.discover_renderers()] == ["uuid:test-1234"]
+        search.assert_not_awaited()
+
+    async def test_expired_cache_searches_synchronously(self, monkeypatch):
+        fresh = _make_renderer(udn="uuid:new")
+        monkeypatch.setattr(discovery, "_search_renderers", AsyncMock(return_value=[fresh]))
+        self._seed(discovery.CACHE_TTL + 1, _make_renderer(udn="uuid:old"))
+        assert [r.udn for r in await discovery.discover_renderers()] == ["uuid:new"]
+
+    async def test_near_expiry_serves_cache_and_refreshes_in_background(self, monkeypatch):
+        fresh = _make_renderer(udn="uuid:new")
+        search = AsyncMock(return_value=[fresh])
+        monkeypatch.setattr(discovery, "_search_renderers", search)
+        self._seed(discovery.CACHE_TTL - 1, _make_renderer(udn="uuid:old"))
+        out = await discovery.discover_renderers()
+        assert [r.udn for r in out] == ["uuid:old"]  # no wait on SSDP
+        await discovery._refresh_task
+        search.assert_awaited_once()
+        # Merged: the old entry lingers until its own TTL, the new one is added.
+        assert set(discovery._renderer_cache) == {"uuid:old", "uuid:new"}
+
+    async def test_force_replaces_cache(self, monkeypatch):
+        fresh = _make_renderer(udn="uuid:new")
+        monkeypatch.setattr(discovery, "_search_renderers", AsyncMock(return_value=[fresh]))
+        self._seed(0, _make_renderer(udn="uuid:old"))
+        out = await discovery.discover_renderers(force=True)
+        assert [r.udn for r in out] == ["uuid:new"]
+
+    async def test_find_renderer_reuses_index_until_cache_changes(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_search_renderers", AsyncMock())
+        self._seed(0, _make_renderer(name="Küche", udn="uuid:k"))
+        assert (await discovery.find_renderer("KÜCHE")).udn == "uuid:k"
+        _, index = discovery._renderer_snapshot()
+        assert (await discovery.find_renderer("üch")).udn == "uuid:k"
+        assert discovery._renderer_snapshot()[1] is index  # no rebuild
+        discovery.invalidate_renderer("uuid:k")
+        assert discovery._renderer_snapshot()[1] is not index
+
+    async def test_find_server_reuses_index_for_cached_list(self, monkeypatch):
+        servers = [_make_server("Jellyfin"), _make_server("MinimServer", "uuid:srv-2")]
+        monkeypatch.setattr(discovery, "discover_servers", AsyncMock(return_value=servers))
+        monkeypatch.setattr(discovery, "_server_index", None)
+        assert (await discovery.find_server("minim")).udn == "uuid:srv-2"
+        index = discovery._server_index[1]
+        assert (await discovery.find_server("JELLYFIN")).name == "Jellyfin"
+        assert discovery._server_index[1] is index  # same list, no rebuild
+
+    async def test_find_renderer_served_from_cache_unless_refresh(self, monkeypatch):
+        search = AsyncMock(return_value=[_make_renderer(name="Küche", udn="uuid:new")])
+        monkeypatch.setattr(discovery, "_search_renderers", search)
+        self._seed(0, _make_renderer(name="Küche", udn="uuid:old"))
+        assert (await discovery.find_renderer("Küche")).udn == "uuid:old"
+        search.assert_not_awaited()
+        assert (await discovery.find_renderer("Küche", refresh=True)).udn == "uuid:new"
+        search.assert_awaited_once()
+
+    async def test_disk_cache_round_trip_seeds_next_process(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        monkeypatch.setattr(discovery, "_is_reachable", AsyncMock(return_value=True))
+        search = AsyncMock(return_value=[_make_renderer(udn="uuid:a")])
+        monkeypatch.setattr(discovery, "_search_renderers", search)
+        await discovery.discover_renderers(force=True)
+
+        # "Next process": empty memory cache, nothing loaded from disk yet.
+        discovery._renderer_cache = {}
+        discovery._cache_time = 0
+        discovery._disk_cache_loaded = False
+        monkeypatch.setattr(discovery, "_schedule_refresh", MagicMock())
+        out = await discovery.discover_renderers()
+        assert [r.udn for r in out] == ["uuid:a"]
+        search.assert_awaited_once()  # served from disk, no second search
+        discovery._schedule_refresh.assert_called_once()  # seeded near expiry
+
+    async def test_disk_cache_ignores_other_network_and_dead_devices(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        self._seed(0, _make_renderer(udn="uuid:a"), _make_renderer(udn="uuid:b"))
+        await discovery._save_disk_cache()
+        discovery._renderer_cache = {}
+
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["192.168.9.9"])
+        assert discovery._read_disk_cache() == []  # different network
+
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        monkeypatch.setattr(discovery, "_is_reachable", AsyncMock(side_effect=[True, False]))
+        await discovery._load_disk_cache()
+        assert set(discovery._renderer_cache) == {"uuid:a"}
+
+    async def test_disk_cache_survives_empty_search(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        search = AsyncMock(side_effect=[[_make_renderer(udn="uuid:a")], []])
+        monkeypatch.setattr(discovery, "_search_renderers", search)
+        await discovery.discover_renderers(force=True)
+        await discovery.discover_renderers(force=True)  # blip: nothing answered
+        assert [r.udn for r in discovery._read_disk_cache()] == ["uuid:a"]
+
+    def test_disk_cache_skips_mistyped_entries(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        good = asdict(_make_renderer(udn="uuid:a"))
+        discovery._write_disk_cache(
+            [
+                {**good, "udn": "uuid:num", "name": 42},
+                {**good, "udn": "uuid:flag", "supports_next": "yes"},
+                "not-an-entry",
+                good,
+            ]
+        )
+        assert [r.udn for r in discovery._read_disk_cache()] == ["uuid:a"]
+        cache_dir = os.path.dirname(discovery._disk_cache_path())
+        assert os.listdir(cache_dir) == ["renderers.json"]  # no temp file left
+
+    def test_network_id_ignores_random_node(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
+        monkeypatch.setattr(discovery.uuid, "getnode", lambda: 0x0242AC110002)
+        assert discovery._network_id() == "0242ac110002|10.0.0.5"
+        # Random fallback node (multicast bit set): differs per process, so unused.
+        ids = set()
+        for node in (0x013456789ABC, 0x03FEDCBA9876):
+            monkeypatch.setattr(discovery.uuid, "getnode", lambda n=node: n)
+            ids.add(discovery._network_id())
+        assert ids == {"-|10.0.0.5"}
+
+    def test_invalidate_drops_only_that_renderer(self):
+        self._seed(0, _make_renderer(udn="uuid:a"), _make_renderer(udn="uuid:b"))
+        discovery.invalidate_renderer("uuid:a")
+        discovery.invalidate_renderer("uuid:unknown")  # no-op
+        assert set(discovery._renderer_cache) == {"uuid:b"}
+
+    @pytest.mark.parametrize("evict", ["invalidate", "ttl"])
+    async def test_eviction_drops_parsed_device_tree(self, monkeypatch, evict):
+        # Works on every transport: no SSDP listener involved.
+        built = []
+
+        async def _create(self, url):
+            built.append(url)
+            dev = MagicMock()
+            dev.udn = "uuid:k"
+            return dev
+
+        monkeypatch.setattr(cp_module.UpnpFactory, "async_create_device", _create)
+        cp = queue_manager._default_control_point
+        factory = cp_module._CachingFactory(MagicMock(), cp._device_cache)
+        url = "http://tv/desc.xml"
+        await factory.async_create_device(url)
+        await factory.async_create_device(url)
+        assert built == [url]  # served from the device cache
+
+        if evict == "invalidate":
+            self._seed(0, _make_renderer(udn="uuid:k"))
+            discovery.invalidate_renderer("uuid:k")
+        else:
+            self._seed(discovery.CACHE_TTL + 1, _make_renderer(udn="uuid:k"))
+            assert discovery._live_renderers(discovery.time.time()) == []
+        assert url not in cp._device_cache
+        await factory.async_create_device(url)
+        assert built == [url, url]  # fetched again after eviction
+        cp._device_cache.clear()
 
 
 # ---------------------------------------------------------------------------
@@ -255,6 +536,18 @@ class TestPlayTracks:
             assert "error" in result
             assert "Invalid tracks JSON" in result["error"]
 
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    async def test_json_parsing_with_and_without_orjson(self, monkeypatch, use_orjson):
+        if not use_orjson:
+            monkeypatch.setattr(server, "orjson", None)
+        elif server.orjson is None:
+            pytest.skip("orjson not installed")
+        assert server._loads_json('[{"url": "http://x/a.flac"}]') == [{"url": "http://x/a.flac"}]
+        with patch.object(discovery, "find_renderer", new_callable=AsyncMock,
+                          return_value=_make_renderer()):
+            result = await server.play_tracks("HiFiBerry", "not json")
+        assert "Invalid tracks JSON" in result["error"]
+
     async def test_empty_tracks(self):
         renderer = _make_renderer()
         with patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer):
@@ -278,7 +571,7 @@ class TestPlayTracks:
             {"url": "http://jellyfin/track2.flac", "title": "Track 2", "artist": "Artist"},
         ])
 
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         with (
             patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
             patch.object(queue_manager, "play_tracks", new_callable=AsyncMock, return_value=mock_session),
@@ -298,10 +591,7 @@ class TestStop:
 
     async def test_no_active_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.stop("HiFiBerry")
             assert result["success"] is False
             assert "error" in result
@@ -309,12 +599,9 @@ class TestStop:
 
     async def test_successful_stop(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.stop = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.stop("HiFiBerry")
             assert result.get("success") is True
             mock_session.stop.assert_awaited_once()
@@ -324,55 +611,75 @@ class TestNextTrack:
     async def test_successful_next(self):
         renderer = _make_renderer()
         track = Track(url="http://jellyfin/track2.flac", title="Track 2", artist="Artist")
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.next = AsyncMock(return_value=track)
         mock_session.current_index = 1
-        mock_session.tracks = _make_tracks(3)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        mock_session.tracks = _TRACKS_3
+        with _patch_resolve(renderer, mock_session):
             result = await server.next_track("HiFiBerry")
             assert result.get("success") is True
             assert result["now_playing"]["title"] == "Track 2"
 
     async def test_at_last_track(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.next = AsyncMock(return_value=None)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.next_track("HiFiBerry")
             assert result["success"] is False
             assert "error" in result
             assert "last track" in result["error"]
 
 
+class TestSessionNameFastPath:
+    @pytest.fixture
+    def active(self):
+        session = _StubSession()
+        session.renderer = _make_renderer(name="HiFiBerry Garten")
+        session.stop = AsyncMock()
+        cp = queue_manager._default_control_point
+        cp.sessions[session.renderer.udn] = session
+        yield session
+        cp.sessions.pop(session.renderer.udn, None)
+
+    async def test_exact_name_skips_discovery(self, active):
+        with patch.object(discovery, "find_renderer", new_callable=AsyncMock) as fr:
+            result = await server.stop("hifiberry garten")
+        assert result["success"] is True
+        fr.assert_not_awaited()
+        active.stop.assert_awaited_once()
+
+    async def test_partial_name_still_uses_discovery(self, active):
+        with (
+            patch.object(discovery, "find_renderer", new_callable=AsyncMock,
+                         return_value=active.renderer) as fr,
+            patch.object(queue_manager, "get_session", return_value=active),
+        ):
+            result = await server.stop("Garten")
+        assert result["success"] is True
+        fr.assert_awaited_once()
+
+    def test_no_match_returns_none(self, active):
+        assert queue_manager.find_session_by_name("Küche") is None
+
+
 class TestPreviousTrack:
     async def test_successful_previous(self):
         renderer = _make_renderer()
         track = Track(url="http://jellyfin/track1.flac", title="Track 1", artist="Artist")
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.previous = AsyncMock(return_value=track)
         mock_session.current_index = 0
-        mock_session.tracks = _make_tracks(3)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        mock_session.tracks = _TRACKS_3
+        with _patch_resolve(renderer, mock_session):
             result = await server.previous_track("HiFiBerry")
             assert result.get("success") is True
 
     async def test_at_first_track(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.previous = AsyncMock(return_value=None)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.previous_track("HiFiBerry")
             assert result["success"] is False
             assert "error" in result
@@ -382,16 +689,13 @@ class TestPreviousTrack:
 class TestGetStatus:
     async def test_no_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.get_status("HiFiBerry")
             assert result["state"] == "idle"
 
     async def test_active_session(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.status.return_value = {
             "renderer": "HiFiBerry Garten",
             "state": "playing",
@@ -401,10 +705,7 @@ class TestGetStatus:
             "artist": "Foreigner",
             "album": "The Very Best",
         }
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_status("HiFiBerry")
             assert result["state"] == "playing"
             assert result["track"] == 2
@@ -414,41 +715,31 @@ class TestGetStatus:
 class TestSetVolume:
     async def test_successful_volume(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_volume = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_volume("HiFiBerry", 75)
             assert result.get("success") is True
             assert result["volume"] == 75
             mock_session.set_volume.assert_awaited_once_with(75)
 
-    async def test_volume_clamped(self):
+    @pytest.mark.parametrize(("requested", "clamped"), [(150, 100), (-10, 0), (100, 100), (0, 0)])
+    async def test_volume_clamped(self, requested, clamped):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
-        mock_session.set_volume = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
-            result = await server.set_volume("HiFiBerry", 150)
-            assert result["volume"] == 100
-
-            result = await server.set_volume("HiFiBerry", -10)
-            assert result["volume"] == 0
+        mock_session = _StubSession()
+        with _patch_resolve(renderer, mock_session):
+            result = await server.set_volume("HiFiBerry", requested)
+            assert result["volume"] == clamped
+            # Clamped before the one device call — never a second round trip.
+            mock_session.set_volume.assert_awaited_once_with(clamped)
 
 
 class TestGetVolume:
     async def test_returns_cached_volume(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.get_volume = AsyncMock(return_value=42)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_volume("HiFiBerry")
             assert result.get("success") is True
             assert result["volume"] == 42
@@ -456,22 +747,16 @@ class TestGetVolume:
 
     async def test_volume_none_when_unreportable(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.get_volume = AsyncMock(return_value=None)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_volume("HiFiBerry")
             assert result.get("success") is True
             assert result["volume"] is None
 
     async def test_no_active_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.get_volume("HiFiBerry")
             assert result.get("success") is False
             assert "No active playback" in result["error"]
@@ -488,12 +773,9 @@ class TestGetVolume:
 class TestSetMute:
     async def test_mute(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_mute = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_mute("HiFiBerry", True)
             assert result.get("success") is True
             assert result["muted"] is True
@@ -501,12 +783,9 @@ class TestSetMute:
 
     async def test_unmute(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_mute = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_mute("HiFiBerry", False)
             assert result.get("success") is True
             assert result["muted"] is False
@@ -514,10 +793,7 @@ class TestSetMute:
 
     async def test_no_active_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.set_mute("HiFiBerry", True)
             assert result.get("success") is False
             assert "No active playback" in result["error"]
@@ -532,12 +808,9 @@ class TestSetMute:
 
     async def test_set_mute_failure(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_mute = AsyncMock(side_effect=RuntimeError("upnp error"))
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_mute("HiFiBerry", True)
             assert result.get("success") is False
             assert "Failed to set mute" in result["error"]
@@ -550,8 +823,7 @@ class TestSetMute:
 class TestQueueSessionStatusFields:
     def test_status_returns_correct_info(self):
         renderer = _make_renderer()
-        tracks = _make_tracks(5)
-        session = QueueSession(renderer, tracks)
+        session = QueueSession(renderer, list(_TRACKS_5))
         session.current_index = 2
 
         status = session.status()
@@ -594,6 +866,26 @@ class TestTrackDataclass:
         track = Track(url="http://example.com/video.mp4", media_type="video")
         assert track.media_type == "video"
 
+    def test_slotted_no_instance_dict(self):
+        for obj in (Track(url="http://x/a.flac"), _make_renderer(), _make_server()):
+            assert not hasattr(obj, "__dict__")
+
+    def test_frozen_and_hashable(self):
+        import dataclasses
+
+        track = Track(url="http://x/a.flac", title="A")
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            track.title = "B"
+        assert hash(track) == hash(Track(url="http://x/a.flac", title="A"))
+
+    def test_renderer_frozen_and_hashable(self):
+        import dataclasses
+
+        r = _make_renderer()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            r.is_openhome = True
+        assert {r: 1}[_make_renderer()] == 1  # equal fields, same key
+
 
 # ---------------------------------------------------------------------------
 # Video DIDL-Lite Tests
@@ -644,7 +936,7 @@ class TestPlayTracksVideo:
             {"url": "http://jellyfin/Videos/m1/stream", "title": "Interstellar", "media_type": "video"},
         ])
 
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         with (
             patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
             patch.object(queue_manager, "play_tracks", new_callable=AsyncMock, return_value=mock_session) as mock_play,
@@ -661,7 +953,7 @@ class TestPlayTracksVideo:
             {"url": "http://jellyfin/Audio/a1/stream", "title": "Song 1"},
         ])
 
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         with (
             patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
             patch.object(queue_manager, "play_tracks", new_callable=AsyncMock, return_value=mock_session) as mock_play,
@@ -1064,6 +1356,32 @@ class TestStopEventGuards:
         s._auto_advance.assert_not_awaited()
         s._cleanup.assert_not_awaited()
 
+    async def test_event_actions_run_serially_in_order(self):
+        s = QueueSession(_make_renderer(), _make_tracks(3))
+        order = []
+
+        async def _slow(tag):
+            order.append(f"{tag}-start")
+            await asyncio.sleep(0.01)
+            order.append(f"{tag}-end")
+
+        s._dispatch(lambda: _slow("a"))
+        s._dispatch(lambda: _slow("b"))
+        await s._drain_task
+        assert order == ["a-start", "a-end", "b-start", "b-end"]
+
+    async def test_stop_drops_pending_event_actions(self):
+        s = QueueSession(_make_renderer(), _make_tracks(3))
+        s.backend = MagicMock()
+        s.backend.disconnect = AsyncMock()
+        s.control_point = MagicMock()
+        s.control_point.unregister = AsyncMock()
+        late = AsyncMock()
+        s._dispatch(late)
+        await s.stop()
+        await asyncio.sleep(0)
+        late.assert_not_awaited()
+
 
 # ---------------------------------------------------------------------------
 # PlaybackBackend seam (Phase 1 backend extraction)
@@ -1152,7 +1470,7 @@ def _desc_session(xml: str):
     (and an empty SCPD so SetNext detection runs without error)."""
     resp = MagicMock()
     resp.status = 200
-    resp.text = AsyncMock(return_value=xml)
+    resp.read = AsyncMock(return_value=xml.encode("utf-8"))
     ctx = MagicMock()
     ctx.__aenter__ = AsyncMock(return_value=resp)
     ctx.__aexit__ = AsyncMock(return_value=False)
@@ -1185,6 +1503,94 @@ class TestDeviceIdentity:
         assert r.is_openhome is True
         assert r.manufacturer == "Linn"
 
+    async def test_external_entities_are_not_resolved(self, tmp_path):
+        # Descriptions are LAN-spoofable: an XXE payload must not pull local
+        # files into the parsed identity fields.
+        secret = tmp_path / "secret.txt"
+        secret.write_text("TOP-SECRET")
+        xml = _DESC_TMPL.format(
+            name="&xxe;", mfr="Evil", model="X", extra_service=""
+        ).replace(
+            '<?xml version="1.0"?>',
+            f'<?xml version="1.0"?><!DOCTYPE root [<!ENTITY xxe SYSTEM "file://{secret}">]>',
+        )
+        r = await discovery._fetch_device_description(
+            _desc_session(xml), "http://1.2.3.4:8080/desc.xml"
+        )
+        assert r is None or "TOP-SECRET" not in r.name
+
+    async def test_service_urls_resolved_against_location(self):
+        xml = _DESC_TMPL.format(
+            name="TV", mfr="", model="", extra_service=""
+        ).replace("/AVTransport/ctrl", "AVTransport/ctrl")  # document-relative
+        session = _desc_session(xml)
+        r = await discovery._fetch_device_description(
+            session, "http://1.2.3.4:8080/dev/desc.xml"
+        )
+        assert r.av_transport_control_url == "http://1.2.3.4:8080/dev/AVTransport/ctrl"
+        assert r.base_url == "http://1.2.3.4:8080"
+        session.get.assert_called_with(
+            "http://1.2.3.4:8080/AVTransport/scpd.xml", timeout=ANY
+        )
+
+    async def test_url_base_element_takes_precedence(self):
+        xml = _DESC_TMPL.format(name="TV", mfr="", model="", extra_service="").replace(
+            "<device>", "<URLBase>http://1.2.3.4:9000/</URLBase><device>", 1
+        )
+        r = await discovery._fetch_device_description(
+            _desc_session(xml), "http://1.2.3.4:8080/desc.xml"
+        )
+        assert r.av_transport_control_url == "http://1.2.3.4:9000/AVTransport/ctrl"
+
+    async def test_malformed_description_is_skipped(self):
+        r = await discovery._fetch_device_description(
+            _desc_session("<root><device>"), "http://1.2.3.4:8080/desc.xml"
+        )
+        assert r is None
+
+
+_SCPD_TMPL = """<?xml version="1.0"?>
+<scpd xmlns="urn:schemas-upnp-org:service-1-0">
+  <actionList>
+    <action><name>SetAVTransportURI</name></action>
+    {extra_action}
+    <action><name>Play</name></action>
+  </actionList>
+  <serviceStateTable>
+    <stateVariable><name>TransportState</name></stateVariable>
+  </serviceStateTable>
+</scpd>"""
+
+
+class TestScpdActionScan:
+    def test_finds_set_next_action(self):
+        xml = _SCPD_TMPL.format(
+            extra_action="<action><name>SetNextAVTransportURI</name></action>"
+        )
+        assert discovery._scpd_has_action(xml.encode(), "SetNextAVTransportURI")
+
+    def test_absent_action(self):
+        xml = _SCPD_TMPL.format(extra_action="")
+        assert not discovery._scpd_has_action(xml.encode(), "SetNextAVTransportURI")
+
+    def test_malformed_scpd_is_false(self):
+        assert not discovery._scpd_has_action(b"<scpd><actionList>", "Play")
+
+    def test_match_before_trailing_garbage_still_found(self):
+        # Streaming stops at the match, so junk after it is never parsed.
+        xml = _SCPD_TMPL.format(
+            extra_action="<action><name>SetNextAVTransportURI</name></action>"
+        ).replace("</scpd>", "<broken")
+        assert discovery._scpd_has_action(xml.encode(), "SetNextAVTransportURI")
+
+    async def test_check_set_next_support_fetches_and_scans(self):
+        xml = _SCPD_TMPL.format(
+            extra_action="<action><name>SetNextAVTransportURI</name></action>"
+        )
+        assert await discovery._check_set_next_support(
+            _desc_session(xml), "http://1.2.3.4:8080/AVTransport/scpd.xml"
+        )
+
 
 # (OpenHome factory routing is covered by TestOpenHomeFactoryRouting below.)
 
@@ -1239,7 +1645,6 @@ class TestControlPoint:
         fake_server = MagicMock()
         fake_server.async_start_server = AsyncMock(side_effect=_start)
         fake_server.callback_url = "http://127.0.0.1:0/cb"
-        monkeypatch.setattr(cp_module, "AiohttpRequester", MagicMock())
         monkeypatch.setattr(cp_module, "AiohttpNotifyServer", MagicMock(return_value=fake_server))
         monkeypatch.setattr(cp_module, "UpnpEventHandler", MagicMock())
         monkeypatch.setattr(cp_module, "UpnpFactory", MagicMock())
@@ -1251,6 +1656,79 @@ class TestControlPoint:
         assert cp.started is True
         assert cp.factory is not None
 
+    async def test_factory_reuses_parsed_device_across_sessions(self, monkeypatch):
+        built = []
+
+        async def _create(self, url):
+            dev = MagicMock()
+            dev.udn = "uuid:tv"
+            built.append(url)
+            return dev
+
+        monkeypatch.setattr(cp_module.UpnpFactory, "async_create_device", _create)
+        cp = ControlPoint()
+        factory = cp_module._CachingFactory(MagicMock(), cp._device_cache)
+        first = await factory.async_create_device("http://tv/desc.xml")
+        assert await factory.async_create_device("http://tv/desc.xml") is first
+        assert built == ["http://tv/desc.xml"]  # fetched/parsed once
+
+        cp.forget_device("uuid:other")
+        assert "http://tv/desc.xml" in cp._device_cache
+        cp.forget_device("uuid:tv")
+        assert cp._device_cache == {}
+
+    async def test_requester_keeps_one_session_until_aclose(self, monkeypatch):
+        async def _request(self, http_request):
+            return self._session
+
+        monkeypatch.setattr(cp_module.AiohttpSessionRequester, "async_http_request", _request)
+        cp = ControlPoint()
+        req = cp._requester
+        first = await req.async_http_request(MagicMock())
+        assert await req.async_http_request(MagicMock()) is first  # kept alive
+        await cp.aclose()
+        assert first.closed
+        assert cp._requester is req  # cached devices still hold this requester
+        second = await req.async_http_request(MagicMock())
+        assert second is not first and not second.closed  # reopened on demand
+        await req.aclose()
+
+    async def test_aclose_during_inflight_request_waits_for_it(self):
+        from aiohttp import web
+        from async_upnp_client.client import HttpRequest
+
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        async def _slow(request):
+            entered.set()
+            await release.wait()
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/desc.xml", _slow)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            cp = ControlPoint()
+            req = cp._requester
+            url = f"http://127.0.0.1:{port}/desc.xml"
+            inflight = asyncio.create_task(
+                req.async_http_request(HttpRequest("GET", url, {}, None))
+            )
+            await entered.wait()
+            session = req._session
+            await cp.aclose()  # last playback session leaves mid-request
+            assert not session.closed  # deferred while the request runs
+            release.set()
+            resp = await inflight
+            assert (resp.status_code, resp.body) == (200, "ok")
+            assert session.closed and req._session is None  # closed once idle
+        finally:
+            await runner.cleanup()
+
     def test_detect_local_ip_honours_env_override(self, monkeypatch):
         monkeypatch.setenv("DLNA_LISTEN_IP", "10.0.0.5")
         assert cp_module.detect_local_ip() == "10.0.0.5"
@@ -1353,34 +1831,25 @@ class TestStatusEnrichment:
 class TestGetMuteTool:
     async def test_returns_mute_state(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.get_mute = AsyncMock(return_value=True)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_mute("HiFiBerry")
             assert result.get("success") is True
             assert result["muted"] is True
 
     async def test_muted_none_when_unreportable(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.get_mute = AsyncMock(return_value=None)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_mute("HiFiBerry")
             assert result.get("success") is True
             assert result["muted"] is None
 
     async def test_no_active_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.get_mute("HiFiBerry")
             assert result.get("success") is False
             assert "No active playback" in result["error"]
@@ -1395,15 +1864,12 @@ class TestGetMuteTool:
 class TestGetStatusEnrichment:
     async def test_status_tool_adds_volume_and_muted(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.refresh_state = AsyncMock()
         mock_session.status.return_value = {"renderer": "HiFiBerry Garten", "state": "playing"}
         mock_session.get_volume = AsyncMock(return_value=44)
         mock_session.get_mute = AsyncMock(return_value=False)
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.get_status("HiFiBerry")
             assert result["state"] == "playing"
             assert result["volume"] == 44
@@ -1467,12 +1933,9 @@ class TestBackendSeekPlayMode:
 class TestSeekTool:
     async def test_seek_success(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.seek = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.seek("HiFiBerry", 75)
             assert result.get("success") is True
             assert result["position"] == 75
@@ -1480,22 +1943,16 @@ class TestSeekTool:
 
     async def test_seek_failure_surfaced(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.seek = AsyncMock(side_effect=RuntimeError("does not support seek"))
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.seek("HiFiBerry", 10)
             assert result.get("success") is False
             assert "Seek failed" in result["error"]
 
     async def test_seek_no_session(self):
         renderer = _make_renderer()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=None),
-        ):
+        with _patch_resolve(renderer):
             result = await server.seek("HiFiBerry", 10)
             assert result.get("success") is False
             assert "No active playback" in result["error"]
@@ -1504,12 +1961,9 @@ class TestSeekTool:
 class TestSetPlayModeTool:
     async def test_set_play_mode_success(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_play_mode = AsyncMock()
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_play_mode("HiFiBerry", "Shuffle")
             assert result.get("success") is True
             assert result["play_mode"] == "shuffle"  # normalized
@@ -1517,12 +1971,9 @@ class TestSetPlayModeTool:
 
     async def test_set_play_mode_failure_surfaced(self):
         renderer = _make_renderer()
-        mock_session = MagicMock(spec=QueueSession)
+        mock_session = _StubSession()
         mock_session.set_play_mode = AsyncMock(side_effect=RuntimeError("does not support play mode 'random'"))
-        with (
-            patch.object(discovery, "find_renderer", new_callable=AsyncMock, return_value=renderer),
-            patch.object(queue_manager, "get_session", return_value=mock_session),
-        ):
+        with _patch_resolve(renderer, mock_session):
             result = await server.set_play_mode("HiFiBerry", "random")
             assert result.get("success") is False
             assert "Failed to set play mode" in result["error"]
@@ -1777,8 +2228,7 @@ class TestMetadataStrategy:
         assert "DLNA.ORG_FLAGS=" in out
 
     def test_video_on_tv_family_detected(self):
-        tv = _make_renderer(name="Samsung TV", udn="uuid:tv")
-        tv.manufacturer = "Samsung"
+        tv = _make_renderer(name="Samsung TV", udn="uuid:tv", manufacturer="Samsung")
         assert md_strategy._is_tv(tv) is True
         out = md_strategy.build(Track(url="http://x/v.mp4", media_type="video"), tv)
         assert "DLNA.ORG_FLAGS=" in out
@@ -1807,6 +2257,16 @@ class TestMetadataMemoization:
             mb.assert_not_called()  # served from cache, no rebuild
         assert second == first
 
+    def test_didl_builders_are_memoised_across_sessions(self):
+        from renfield_mcp_dlna import didl
+
+        didl.build_didl_metadata.cache_clear()
+        for _ in range(2):
+            s = QueueSession(_make_renderer(), [Track(url="http://x/a.flac", title="A")])
+            s._build_metadata(s.tracks[0])
+        info = didl.build_didl_metadata.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
 
 # ---------------------------------------------------------------------------
 # T10: OpenHomeBackend (Linn / device-owned queue) — env-gated, provisional
@@ -1914,14 +2374,12 @@ class TestOpenHomeBackend:
 class TestOpenHomeFactoryRouting:
     def test_openhome_is_default_for_openhome_renderers(self, monkeypatch):
         monkeypatch.delenv("RENFIELD_OPENHOME", raising=False)
-        r = _make_renderer()
-        r.is_openhome = True
+        r = _make_renderer(is_openhome=True)
         assert isinstance(queue_manager._make_backend(r), OpenHomeBackend)
 
     def test_opt_out_falls_back_to_avtransport(self, monkeypatch):
         monkeypatch.setenv("RENFIELD_OPENHOME", "0")
-        r = _make_renderer()
-        r.is_openhome = True
+        r = _make_renderer(is_openhome=True)
         assert isinstance(queue_manager._make_backend(r), AvTransportBackend)
 
     def test_non_openhome_renderer_uses_avtransport(self, monkeypatch):
@@ -2021,14 +2479,12 @@ class TestSonosBackend:
 class TestSonosFactoryRouting:
     def test_routes_to_sonos_when_env_enabled(self, monkeypatch):
         monkeypatch.setenv("RENFIELD_SONOS", "1")
-        r = _make_renderer()
-        r.is_sonos = True
+        r = _make_renderer(is_sonos=True)
         assert isinstance(queue_manager._make_backend(r), SonosBackend)
 
     def test_defaults_to_avtransport_without_env(self, monkeypatch):
         monkeypatch.delenv("RENFIELD_SONOS", raising=False)
-        r = _make_renderer()
-        r.is_sonos = True
+        r = _make_renderer(is_sonos=True)
         assert isinstance(queue_manager._make_backend(r), AvTransportBackend)
 
 
@@ -2075,29 +2531,117 @@ class TestMultiInterfaceSearch:
     async def test_search_fans_out_over_interfaces(self, monkeypatch):
         calls = []
 
-        async def _fake_single(st, timeout, source_ip=None):
-            calls.append(source_ip)
+        async def _fake_iface(targets, timeout, source_ip=None):
+            calls.append((source_ip, targets))
             return [f"http://{source_ip or 'default'}/d.xml"]
 
-        monkeypatch.setattr(discovery, "_ssdp_search_single", _fake_single)
+        monkeypatch.setattr(discovery, "_ssdp_search_interface", _fake_iface)
         monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
         locs = await discovery._ssdp_search(timeout=0.01)
-        # 2 search targets × (default-route + one interface)
-        assert calls.count(None) == 2
-        assert calls.count("10.0.0.5") == 2
+        # One socket per interface (default-route + one), each carrying both STs
+        assert [ip for ip, _ in calls] == [None, "10.0.0.5"]
+        assert all(t == ("urn:schemas-upnp-org:device:MediaRenderer:1",
+                         "upnp:rootdevice") for _, t in calls)
         assert any("10.0.0.5" in loc for loc in locs)
 
+    def test_msearch_carries_configured_mx(self, monkeypatch):
+        monkeypatch.setattr(discovery, "_SSDP_MX", 1)
+        assert b"\r\nMX: 1\r\n" in discovery._build_msearch()
+
+    @pytest.mark.parametrize(("raw", "expected"), [("3", 3), ("9", 5), ("0", 1), ("x", 2)])
+    def test_env_int_clamps_and_falls_back(self, monkeypatch, raw, expected):
+        monkeypatch.setenv("RENFIELD_SSDP_MX", raw)
+        assert discovery._env_int("RENFIELD_SSDP_MX", 2, 1, 5) == expected
+
+    async def test_concurrent_callers_share_one_search(self, monkeypatch):
+        calls = []
+
+        async def _fake_iface(targets, timeout, source_ip=None):
+            calls.append(source_ip)
+            await asyncio.sleep(0.01)
+            return ["http://default/d.xml"]
+
+        monkeypatch.setattr(discovery, "_ssdp_search_interface", _fake_iface)
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", list)
+        a, b = await asyncio.gather(discovery._ssdp_search(), discovery._ssdp_search())
+        assert a == b == ["http://default/d.xml"]
+        assert calls == [None]  # one multicast round, not two
+
+    @pytest.mark.parametrize("second", [{"force": True}, {"timeout": 9.0}])
+    async def test_force_or_other_timeout_starts_own_search(self, monkeypatch, second):
+        calls = []
+
+        async def _fake_iface(targets, timeout, source_ip=None):
+            calls.append(timeout)
+            await asyncio.sleep(0.01)
+            return ["http://default/d.xml"]
+
+        monkeypatch.setattr(discovery, "_ssdp_search_interface", _fake_iface)
+        monkeypatch.setattr(discovery, "_local_ipv4_addresses", list)
+        await asyncio.gather(discovery._ssdp_search(timeout=3.0),
+                             discovery._ssdp_search(**{"timeout": 3.0, **second}))
+        # No join: the second caller keeps its own timeout / a post-change scan.
+        assert sorted(calls) == sorted([3.0, second.get("timeout", 3.0)])
+
     async def test_search_swallows_per_interface_failure(self, monkeypatch):
-        async def _fake_single(st, timeout, source_ip=None):
+        async def _fake_single(targets, timeout, source_ip=None):
             if source_ip == "10.0.0.5":
                 raise OSError("interface vanished")
             return ["http://default/d.xml"]
 
-        monkeypatch.setattr(discovery, "_ssdp_search_single", _fake_single)
+        monkeypatch.setattr(discovery, "_ssdp_search_interface", _fake_single)
         monkeypatch.setattr(discovery, "_local_ipv4_addresses", lambda: ["10.0.0.5"])
         # The default-route legs still succeed despite the interface leg raising.
         assert await discovery._ssdp_search(timeout=0.01) == ["http://default/d.xml"]
 
+    def test_protocol_collects_locations_deduped_in_order(self):
+        proto = discovery._SsdpProtocol()
+        for loc in ("http://a/d.xml", "http://b/d.xml", "http://a/d.xml"):
+            proto.datagram_received(
+                f"HTTP/1.1 200 OK\r\nLOCATION: {loc}\r\n\r\n".encode(), ("h", 1900)
+            )
+        proto.datagram_received(b"HTTP/1.1 200 OK\r\nST: x\r\n\r\n", ("h", 1900))
+        assert proto.locations == ["http://a/d.xml", "http://b/d.xml"]
+
+    def test_protocol_ignores_non_response_datagrams(self):
+        proto = discovery._SsdpProtocol()
+        proto.datagram_received(
+            b"NOTIFY * HTTP/1.1\r\nLOCATION: http://printer/d.xml\r\n\r\n", ("h", 1900)
+        )
+        assert proto.locations == []
+
+    def test_parse_location_is_case_insensitive_and_trims(self):
+        data = b"HTTP/1.1 200 OK\r\nST: x\r\nLocation:  http://a/d.xml \r\n\r\n"
+        assert discovery._parse_location(data) == "http://a/d.xml"
+        assert discovery._parse_location(b"HTTP/1.1 200 OK\r\nST: x\r\n\r\n") is None
+
+    async def test_single_search_receives_replies_on_the_loop(self, monkeypatch):
+        """End-to-end over loopback: a fake responder answers the M-SEARCH."""
+        loop = asyncio.get_running_loop()
+
+        class _Responder(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                assert data.startswith(b"M-SEARCH")
+                self.transport.sendto(
+                    b"HTTP/1.1 200 OK\r\nLOCATION: http://10.0.0.9/d.xml\r\n\r\n",
+                    addr,
+                )
+
+        transport, _ = await loop.create_datagram_endpoint(
+            _Responder, local_addr=("127.0.0.1", 0)
+        )
+        try:
+            port = transport.get_extra_info("sockname")[1]
+            monkeypatch.setattr(discovery, "_SSDP_ADDR", "127.0.0.1")
+            monkeypatch.setattr(discovery, "_SSDP_PORT", port)
+            locs = await discovery._ssdp_search_interface(("ssdp:all",), timeout=0.05)
+        finally:
+            transport.close()
+        assert locs == ["http://10.0.0.9/d.xml"]
+
 
 # ---------------------------------------------------------------------------
 # OpenHome sibling-device discovery (validated against real Linn hardware)
@@ -2131,9 +2675,8 @@ class TestOpenHomeSiblingDiscovery:
         # The Linn topology: MediaRenderer + separate OpenHome Source device,
         # same host, different UDN. discover_renderers must flag is_openhome and
         # point openhome_location at the sibling.
-        r = _make_renderer(name="Linn", udn="uuid:r")
-        r.location = "http://10.0.0.9:55178/r/device.xml"
-        r.is_openhome = False
+        r = _make_renderer(name="Linn", udn="uuid:r",
+                           location="http://10.0.0.9:55178/r/device.xml")
 
         async def _fake_fetch(session, loc):
             return r if loc == "loc-r" else None
@@ -2147,13 +2690,33 @@ class TestOpenHomeSiblingDiscovery:
                             AsyncMock(return_value=["loc-r", "loc-oh"]))
         monkeypatch.setattr(discovery, "_fetch_device_description", _fake_fetch)
         monkeypatch.setattr(discovery, "_fetch_openhome_location", _fake_oh)
-        discovery._renderer_cache = []
+        discovery._renderer_cache = {}
         discovery._cache_time = 0
         out = await discovery.discover_renderers(force=True)
         assert out[0].is_openhome is True
         assert out[0].openhome_location == "http://10.0.0.9:55178/oh/device.xml"
-        discovery._renderer_cache = []
+        discovery._renderer_cache = {}
         discovery._cache_time = 0
+        await discovery.close_discovery()
+
+    async def test_description_and_openhome_probes_overlap(self, monkeypatch):
+        # The OpenHome probe must not wait for the description round: here the
+        # description fetch only finishes once the probe has started.
+        probe_started = asyncio.Event()
+
+        async def _fake_fetch(session, loc):
+            await probe_started.wait()
+            return _make_renderer()
+
+        async def _fake_oh(session, loc):
+            probe_started.set()
+
+        monkeypatch.setattr(discovery, "_ssdp_search", AsyncMock(return_value=["loc"]))
+        monkeypatch.setattr(discovery, "_fetch_device_description", _fake_fetch)
+        monkeypatch.setattr(discovery, "_fetch_openhome_location", _fake_oh)
+        out = await asyncio.wait_for(discovery._search_renderers(), timeout=1)
+        assert [r.udn for r in out] == ["uuid:test-1234"]
+        await discovery.close_discovery()
 
 
 class TestOpenHomeVersionFlexibleServices:
@@ -2173,8 +2736,7 @@ class TestOpenHomeVersionFlexibleServices:
         assert await b.get_volume() == 72
 
     async def test_connect_uses_openhome_location(self, monkeypatch):
-        r = _make_renderer()
-        r.openhome_location = "http://10.0.0.9:55178/oh/device.xml"
+        r = _make_renderer(openhome_location="http://10.0.0.9:55178/oh/device.xml")
         factory = MagicMock()
         factory.async_create_device = AsyncMock(return_value=MagicMock())
         b = OpenHomeBackend(r)
@@ -2276,6 +2838,38 @@ class TestSsdpListener:
         assert cp._refresh_task is None  # plain search response → ignored
         await cp.stop_background_tasks()
 
+    async def test_byebye_invalidates_that_device_immediately(self, monkeypatch):
+        from async_upnp_client.const import SsdpSource
+
+        captured = {}
+
+        class _FakeListener:
+            def __init__(self, async_callback=None, **kw):
+                captured["cb"] = async_callback
+
+            async def async_start(self):
+                pass
+
+            async def async_stop(self):
+                pass
+
+        monkeypatch.setattr(
+            "async_upnp_client.ssdp_listener.SsdpListener", _FakeListener
+        )
+        gone = []
+        cp = ControlPoint()
+        cp._device_cache["http://tv/desc.xml"] = MagicMock(udn="uuid:tv")
+        await cp.start_discovery_listener(AsyncMock(), on_byebye=gone.append)
+        device = MagicMock()
+        device.udn = "uuid:tv"
+        await captured["cb"](device, "x", SsdpSource.ADVERTISEMENT_ALIVE)
+        assert gone == []
+        assert cp._device_cache  # alive keeps the parsed device
+        await captured["cb"](device, "x", SsdpSource.ADVERTISEMENT_BYEBYE)
+        assert gone == ["uuid:tv"]
+        assert cp._device_cache == {}
+        await cp.stop_background_tasks()
+
     async def test_start_discovery_listener_idempotent(self, monkeypatch):
         class _FakeListener:
             def __init__(self, **kw):